@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple, Any
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from compression import etag_matches
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен - медленнее, но тот же JSON
+    orjson = None
+
+API_CACHE_MAX = int(os.environ.get("SHAMSHYRAQ_API_CACHE_MAX", "512"))
+
+# Поля ресурсов JSON API (для ?fields=)
+FIELDS = {
+    "exercise": ("id", "name", "description", "video_url", "created_at"),
+    "advice": ("id", "name", "content", "video_url", "created_at"),
+    "comments": ("id", "user_id", "first_name", "last_name", "comment", "created_at", "user_name"),
+    "history": ("id", "item_type", "item_id", "item_name", "viewed_at"),
+}
+
+
+def dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def parse_fields(value: Optional[str], allowed: Tuple[str, ...]) -> Optional[Tuple[str, ...]]:
+    """?fields=id,name -> ("id", "name"); ValueError, если поле неизвестно"""
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def project(data: Any, fields: Optional[Tuple[str, ...]]) -> Any:
+    """Оставить только выбранные поля: у объекта, у списка или у data["items"]"""
+    if fields is None or data is None:
+        return data
+    if isinstance(data, list):
+        return [{f: row.get(f) for f in fields} for row in data]
+    if "items" in data:
+        return dict(data, items=project(data["items"], fields))
+    return {f: data.get(f) for f in fields}
+
+
+def json_response(data: Any, status_code: int = 200, headers: Optional[Dict] = None) -> Response:
+    return Response(dumps(data), status_code=status_code, media_type="application/json", headers=headers)
+
+
+class ApiCache:
+    """Готовые тела JSON-ответов по ключу (ресурс, параметры, версия данных).
+
+    Версия берется из счетчиков table_versions, которые триггеры увеличивают
+    при каждой записи, поэтому после записи ключ меняется и старый ответ
+    больше не выдается (он вытесняется по LRU). ETag выводится из того же
+    ключа: при совпадении If-None-Match ответ 304 отдается без обращения к кэшу.
+
+    Версию и данные нужно читать в одном снимке БД (сначала cached(), при
+    промахе - загрузка и store()), иначе тело, прочитанное до записи, попадет
+    в кэш под версией после нее.
+    """
+
+    CACHE_CONTROL = "private, no-cache"
+
+    def __init__(self, max_entries: int = API_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def etag(key: tuple, version) -> str:
+        return '"' + hashlib.sha1(repr((key, version)).encode("utf-8")).hexdigest()[:20] + '"'
+
+    def headers(self, key: tuple, version) -> Dict[str, str]:
+        return {"ETag": self.etag(key, version), "Cache-Control": self.CACHE_CONTROL, "Vary": "Cookie"}
+
+    def cached(self, request: Request, key: tuple, version) -> Optional[Response]:
+        """304 или готовый ответ для этой версии; None - данные нужно загрузить"""
+        headers = self.headers(key, version)
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        with self._lock:
+            body = self._entries.get((key, version))
+            if body is None:
+                return None
+            self._entries.move_to_end((key, version))
+            self.hits += 1
+        return Response(body, media_type="application/json", headers=headers)
+
+    def store(self, key: tuple, version, data: Any) -> Response:
+        """Сохранить загруженные данные под версией, с которой они прочитаны"""
+        if data is None:
+            return json_response({"error": "not found"}, status_code=404)
+        body = dumps(data)
+        with self._lock:
+            self.misses += 1
+            self._entries[(key, version)] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return Response(body, media_type="application/json", headers=self.headers(key, version))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
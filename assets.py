@@ -0,0 +1,336 @@
+"""Сборка статики: уменьшенные WebP/AVIF-варианты картинок, сжатый CSS,
+gzip/brotli-копии текстовых файлов и имена с хэшем содержимого
+(static/build + manifest.json). Файлы из подпапок (static/css/base.css)
+попадают в manifest под относительным путем: asset_url('css/base.css').
+
+Здесь же минификация HTML шаблонов (MinifyHtmlExtension): пробелы и
+комментарии убираются из исходника шаблона один раз при компиляции.
+
+Для картинок нужен Pillow, для brotli - пакет brotli; без них файлы просто
+копируются с хэшем в имени (и сжимаются gzip).
+
+Каждый воркер uvicorn собирает статику при старте, но по очереди - под
+блокировкой файла static/build/.lock (fcntl): первый пересобирает
+изменившееся, остальные находят все готовым. Временные файлы называются по
+pid процесса. SHAMSHYRAQ_BUILD_ASSETS=0 - не собирать при старте (тогда
+python assets.py запускается при развертывании).
+
+    python assets.py            # собрать и вывести отчет
+    python assets.py --report   # только отчет по уже собранным файлам
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict
+
+from jinja2 import pass_context
+from jinja2.ext import Extension
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow не установлен - картинки только копируются
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # Windows - сборка без блокировки между процессами
+    fcntl = None
+
+STATIC_DIR = "static"
+BUILD_DIR = "build"
+MANIFEST = "manifest.json"
+LOCK_FILE = ".lock"
+MAX_IMAGE_WIDTH = int(os.environ.get("SHAMSHYRAQ_MAX_IMAGE_WIDTH", "1600"))
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".jfif", ".png"}
+TEXT_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_manifest: Dict[str, Dict] = {}
+_lock = threading.Lock()
+
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s*([{};,>])\s*")
+# Содержимое этих тегов не трогаем (в скриптах перевод строки значим)
+_HTML_RAW = re.compile(r"(<(script|pre|textarea)\b.*?</\2\s*>)", re.S | re.I)
+_HTML_STYLE = re.compile(r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_SPACE = re.compile(r"\s+")
+
+
+def minify_css(css: str) -> str:
+    css = _CSS_COMMENT.sub("", css)
+    css = _SPACE.sub(" ", css)
+    css = _CSS_SPACE.sub(r"\1", css)
+    # "color: red" -> "color:red"; пробел перед двоеточием (".a :hover") значим и остается
+    css = css.replace(": ", ":").replace(";}", "}")
+    return css.strip()
+
+
+def minify_html(source: str) -> str:
+    """Свернуть пробелы и убрать комментарии; script/pre/textarea остаются как есть"""
+    parts = _HTML_RAW.split(source)
+    out = []
+    # split с двумя группами: текст, тег целиком, имя тега, текст, ...
+    for i in range(0, len(parts), 3):
+        text = _HTML_COMMENT.sub("", parts[i])
+        text = _HTML_STYLE.sub(lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), text)
+        out.append(_SPACE.sub(" ", text))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return "".join(out).strip()
+
+
+class MinifyHtmlExtension(Extension):
+    """Jinja: минифицировать исходник .html-шаблона перед компиляцией"""
+
+    def preprocess(self, source, name, filename=None):
+        if name and name.endswith(".html"):
+            return minify_html(source)
+        return source
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _replace(path: str, data: bytes):
+    """Записать файл целиком через временный (свой у каждого процесса)"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write(build_dir: str, stem: str, ext: str, data: bytes) -> str:
+    name = f"{stem}.{_digest(data)}{ext}"
+    path = os.path.join(build_dir, name)
+    if not os.path.exists(path):
+        _replace(path, data)
+    return name
+
+
+@contextmanager
+def _build_lock(build_dir: str):
+    """Одна сборка за раз на все процессы (без fcntl - без блокировки)"""
+    with open(os.path.join(build_dir, LOCK_FILE), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _image_variants(data: bytes, ext: str) -> Dict[str, bytes]:
+    """Уменьшенная картинка в исходном формате и в WebP/AVIF"""
+    if Image is None:
+        return {"default": data}
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+    resized = image.width > MAX_IMAGE_WIDTH
+    if resized:
+        image.thumbnail((MAX_IMAGE_WIDTH, MAX_IMAGE_WIDTH * 10))
+
+    variants = {}
+    buffer = io.BytesIO()
+    if ext == ".png":
+        image.save(buffer, "PNG", optimize=True)
+    else:
+        image.convert("RGB").save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+    # Если перекодирование не помогло, оставляем исходный файл
+    variants["default"] = buffer.getvalue() if resized or len(buffer.getvalue()) < len(data) else data
+
+    if features.check("webp"):
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=80, method=6)
+        variants["image/webp"] = buffer.getvalue()
+    if features.check("avif"):
+        buffer = io.BytesIO()
+        image.save(buffer, "AVIF", quality=60)
+        variants["image/avif"] = buffer.getvalue()
+    return variants
+
+
+def _build_one(source: str, name: str, build_dir: str, previous: Optional[Dict]) -> Dict:
+    with open(source, "rb") as f:
+        data = f.read()
+    source_hash = _digest(data)
+    source_bytes = len(data)
+    if previous and previous.get("source_hash") == source_hash and all(
+            os.path.exists(os.path.join(build_dir, p)) for p in previous["files"].values()):
+        return dict(previous, source_bytes=source_bytes)
+
+    stem, ext = os.path.splitext(os.path.basename(name))
+    ext = ext.lower()
+    files = {}
+    if ext == ".css":
+        data = minify_css(data.decode("utf-8")).encode("utf-8")
+    if ext in IMAGE_EXTENSIONS:
+        for kind, payload in _image_variants(data, ext).items():
+            out_ext = {"image/webp": ".webp", "image/avif": ".avif"}.get(kind, ".jpg" if ext == ".jfif" else ext)
+            files[kind] = _write(build_dir, stem, out_ext, payload)
+    else:
+        files["default"] = _write(build_dir, stem, ext, data)
+        if ext in TEXT_EXTENSIONS:
+            # Предварительно сжатые копии рядом с файлом: name.gz / name.br
+            target = os.path.join(build_dir, files["default"])
+            _replace(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _replace(target + ".br", brotli.compress(data, quality=11))
+
+    return {
+        "source_hash": source_hash,
+        "source_bytes": source_bytes,
+        "files": files,
+        "bytes": {kind: os.path.getsize(os.path.join(build_dir, p)) for kind, p in files.items()},
+    }
+
+
+def build_assets(static_dir: str = STATIC_DIR) -> Dict[str, Dict]:
+    """Собрать static/build (пересобираются только изменившиеся файлы)"""
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+    with _build_lock(build_dir):
+        manifest = _build_all(static_dir, build_dir)
+    load_manifest(static_dir)
+    return manifest
+
+
+def _build_all(static_dir: str, build_dir: str) -> Dict[str, Dict]:
+    previous = read_manifest(static_dir)
+    manifest = {}
+    for root, dirs, names in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [d for d in dirs if d != BUILD_DIR]
+        dirs.sort()
+        for filename in sorted(names):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            try:
+                manifest[name] = _build_one(source, name, build_dir, previous.get(name))
+            except OSError as e:
+                print(f"Error building asset {name}: {e}")
+
+    # Удаляем файлы прежних сборок; чужие временные файлы без блокировки не трогаем
+    keep = {MANIFEST, LOCK_FILE}
+    for entry in manifest.values():
+        for path in entry["files"].values():
+            keep.update({path, path + ".gz", path + ".br"})
+    for name in os.listdir(build_dir):
+        if name not in keep and (fcntl is not None or not name.endswith(".tmp")):
+            try:
+                os.remove(os.path.join(build_dir, name))
+            except FileNotFoundError:
+                pass
+
+    _replace(os.path.join(build_dir, MANIFEST), json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+    return manifest
+
+
+def read_manifest(static_dir: str = STATIC_DIR) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(static_dir, BUILD_DIR, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_manifest(static_dir: str = STATIC_DIR):
+    global _manifest
+    manifest = read_manifest(static_dir)
+    with _lock:
+        _manifest = manifest
+
+
+def preferred_image_type(request) -> str:
+    """Лучший формат картинок, который принимает браузер (по заголовку Accept)"""
+    accept = request.headers.get("accept", "") if request is not None else ""
+    for kind in ("image/avif", "image/webp"):
+        if kind in accept:
+            return kind
+    return "default"
+
+
+@pass_context
+def asset_url(context, name: str) -> str:
+    """Jinja: {{ asset_url('shamlogo.jpeg') }} -> /static/build/shamlogo.<hash>.webp"""
+    entry = _manifest.get(name)
+    if entry is None:
+        return f"/static/{name}"
+    files = entry["files"]
+    kind = preferred_image_type(context.get("request"))
+    if kind not in files:
+        kind = "image/webp" if kind == "image/avif" and "image/webp" in files else "default"
+    return f"/static/{BUILD_DIR}/{files[kind]}"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Файлы с хэшем в имени: кэшируются навсегда, текст отдается сжатым заранее"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        full_path = str(full_path)
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            compressed = full_path + suffix
+            if encoding in accept_encoding and os.path.exists(compressed):
+                response = FileResponse(
+                    compressed,
+                    status_code=status_code,
+                    media_type=mimetypes.guess_type(full_path)[0],
+                    headers={"Content-Encoding": encoding},
+                )
+                break
+        else:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def report(templates_dir: str = "templates", static_dir: str = STATIC_DIR):
+    """Сколько байт картинок экономит каждая страница"""
+    manifest = read_manifest(static_dir)
+    pattern = re.compile(r"""asset_url\(['"]([^'"]+)['"]\)""")
+    print(f"{'page':<24} {'original':>10} {'default':>10} {'webp':>10} {'avif':>10} {'saved':>7}")
+    for template in sorted(os.listdir(templates_dir)):
+        with open(os.path.join(templates_dir, template), encoding="utf-8") as f:
+            names = pattern.findall(f.read())
+        entries = [manifest[n] for n in names if n in manifest]
+        if not entries:
+            continue
+        original = sum(e["source_bytes"] for e in entries)
+        sizes = {}
+        for kind in ("default", "image/webp", "image/avif"):
+            sizes[kind] = sum(e["bytes"].get(kind, e["bytes"]["default"]) for e in entries)
+        best = min(sizes.values())
+        print(f"{template:<24} {original:>10} {sizes['default']:>10} {sizes['image/webp']:>10} "
+              f"{sizes['image/avif']:>10} {100 * (original - best) / original:>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--report", action="store_true", help="только отчет, без сборки")
+    args = parser.parse_args()
+    if not args.report:
+        build_assets()
+    report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Optional, Dict, List
+
+from datebase import Database, open_db
+
+DB_WORKERS = int(os.environ.get("SHAMSHYRAQ_DB_WORKERS", "8"))
+DB_QUEUE_MAX = int(os.environ.get("SHAMSHYRAQ_DB_QUEUE_MAX", "256"))
+
+
+# Время работы с БД в текущем запросе: [ожидание в очереди, выполнение], если счетчик установлен
+db_timer: ContextVar[Optional[List[float]]] = ContextVar("db_timer", default=None)
+
+
+class DBQueueFull(RuntimeError):
+    """Очередь запросов к БД переполнена"""
+
+
+class DBExecutor:
+    """Отдельный ограниченный пул потоков для работы с БД.
+
+    Блокирующие вызовы SQLite не занимают общий пул потоков Starlette,
+    поэтому страницы без БД не ждут за медленными запросами.
+    """
+
+    def __init__(self, workers: int = DB_WORKERS, max_queue: int = DB_QUEUE_MAX):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise DBQueueFull(f"Database queue is full ({self.max_queue})")
+            self.queued += 1
+            self.submitted += 1
+        loop = asyncio.get_running_loop()
+        spent = [0.0, 0.0]
+        # Место в очереди освобождает тот, кто первым до него дойдет: поток БД или
+        # отмененный вызов (задача в очереди отменяется и _call не выполняется)
+        slot = [True]
+        # Контекст запроса (замеры metrics) должен быть виден и в потоке БД
+        context = contextvars.copy_context()
+        try:
+            return await loop.run_in_executor(self._executor, context.run, self._call,
+                                              time.perf_counter(), slot, spent, fn, args, kwargs)
+        finally:
+            self._release(slot)
+            timer = db_timer.get()
+            if timer is not None:
+                timer[0] += spent[0]
+                timer[1] += spent[1]
+
+    def _release(self, slot: List[bool]):
+        with self._lock:
+            if slot[0]:
+                slot[0] = False
+                self.queued -= 1
+
+    def _call(self, submitted_at: float, slot: List[bool], spent: List[float], fn, args, kwargs):
+        started = time.perf_counter()
+        waited = started - submitted_at
+        spent[0] = waited
+        self._release(slot)
+        with self._lock:
+            self.running += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            spent[1] = elapsed
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_total += elapsed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_avg_seconds": self.wait_total / self.completed if self.completed else 0.0,
+                "wait_max_seconds": self.wait_max,
+                "run_avg_seconds": self.run_total / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _call_db(method: str, args, kwargs):
+    with open_db() as db:
+        return getattr(db, method)(*args, **kwargs)
+
+
+def _run_with_db(fn, args, kwargs):
+    with open_db() as db:
+        return fn(db, *args, **kwargs)
+
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database: await db.get_all_exercises() и т.д.
+
+    Каждый вызов выполняется в DBExecutor на соединении из общего пула.
+    """
+
+    def __init__(self, executor: DBExecutor):
+        self.executor = executor
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not callable(getattr(Database, name, None)):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.executor.run(_call_db, name, args, kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def run(self, fn, *args, **kwargs):
+        """Несколько операций подряд на одном соединении: fn(db, *args)"""
+        return await self.executor.run(_run_with_db, fn, args, kwargs)
+
+
+_executor: Optional[DBExecutor] = None
+
+
+def init_executor(workers: int = DB_WORKERS, max_queue: int = DB_QUEUE_MAX) -> DBExecutor:
+    global _executor
+    _executor = DBExecutor(workers, max_queue)
+    return _executor
+
+
+def close_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def get_executor() -> DBExecutor:
+    global _executor
+    if _executor is None:
+        _executor = DBExecutor()
+    return _executor
+
+
+# Функция для dependency injection
+def get_async_db() -> AsyncDatabase:
+    return AsyncDatabase(get_executor())
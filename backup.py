@@ -0,0 +1,376 @@
+"""Резервные копии advice.db без остановки приложения.
+
+Копия снимается через online backup API SQLite маленькими шагами по
+BACKUP_STEP_PAGES страниц с паузой между шагами. Источник держит одну
+транзакцию чтения на все время копирования: в WAL она не мешает писателям,
+а копия получается согласованной и не начинается заново после каждой
+записи. Режим vacuum (VACUUM INTO) дает сжатую копию без пустых страниц
+за один проход.
+
+Снимок пишется во временный файл, проверяется PRAGMA quick_check (или
+integrity_check) и только потом получает свое имя; рядом кладется .json с
+итогами. Копия переводится в journal_mode=DELETE, так что чтение снимка не
+оставляет рядом -wal/-shm. Если с прошлого снимка база не менялась, новый
+не делается. Хранятся последние BACKUP_KEEP снимков.
+
+Снимки разных процессов идут по очереди (блокировка .lock в папке копий).
+По расписанию их делает один воркер - тот, кто держит .schedule.lock; если
+он завершится, расписание подхватит другой. Снимок по запросу администратора
+делает тот воркер, который получил запрос. Без fcntl (Windows) блокировок
+нет и расписание работает в каждом процессе.
+
+    python backup.py                 # снимок сейчас
+    python backup.py --mode vacuum   # сжатая копия
+    python backup.py --list
+    python backup.py --verify data/backups/advice-20260101-030000-000.db
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Dict, List
+
+from datebase import DB_PATH, connect
+
+try:
+    import fcntl
+except ImportError:  # Windows - без блокировок между процессами
+    fcntl = None
+
+BACKUP_DIR = os.environ.get("SHAMSHYRAQ_BACKUP_DIR", os.path.join(os.path.dirname(DB_PATH), "backups"))
+# backup - online backup API по шагам, vacuum - VACUUM INTO
+BACKUP_MODE = os.environ.get("SHAMSHYRAQ_BACKUP_MODE", "backup")
+BACKUP_STEP_PAGES = int(os.environ.get("SHAMSHYRAQ_BACKUP_STEP_PAGES", "256"))
+BACKUP_STEP_PAUSE = float(os.environ.get("SHAMSHYRAQ_BACKUP_STEP_PAUSE", "0.005"))
+# Снимки по расписанию каждые N секунд; 0 - только вручную
+BACKUP_INTERVAL = float(os.environ.get("SHAMSHYRAQ_BACKUP_INTERVAL", "0"))
+BACKUP_KEEP = int(os.environ.get("SHAMSHYRAQ_BACKUP_KEEP", "7"))
+# quick - PRAGMA quick_check, full - integrity_check, off - без проверки
+BACKUP_CHECK = os.environ.get("SHAMSHYRAQ_BACKUP_CHECK", "quick")
+
+PREFIX = "advice-"
+LOCK_FILE = ".lock"
+SCHEDULE_LOCK_FILE = ".schedule.lock"
+# Служебные файлы SQLite рядом с копией
+SIDECARS = ("-wal", "-shm", "-journal")
+
+
+def change_stamp(db_name=DB_PATH) -> List[int]:
+    """Размер и время изменения файла БД и WAL: без записей они не меняются"""
+    stamp = []
+    for path in (db_name, db_name + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.extend((st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            stamp.extend((0, 0))
+    return stamp
+
+
+def copy_online(db_name: str, dest: str, pages: int = BACKUP_STEP_PAGES, pause: float = BACKUP_STEP_PAUSE) -> int:
+    """Online backup API по шагам; число шагов"""
+    src = connect(db_name, readonly=True)
+    dst = sqlite3.connect(dest)
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        # Отдаем диск и GIL живым запросам между шагами
+        time.sleep(pause)
+
+    try:
+        # Одна транзакция чтения на всю копию: снимок согласован, а записи
+        # других соединений не заставляют начинать копирование заново
+        src.execute("BEGIN")
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        src.backup(dst, pages=pages, progress=progress)
+        src.rollback()
+        # Страницы скопированы вместе с заголовком WAL-базы - копия становится обычным файлом
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+    return steps
+
+
+def copy_vacuum(db_name: str, dest: str):
+    """VACUUM INTO: сжатая копия без свободных страниц"""
+    src = connect(db_name, readonly=True)
+    try:
+        src.execute("VACUUM INTO ?", (dest,))
+    finally:
+        src.close()
+
+
+def verify(path: str, check: str = "full") -> List[str]:
+    """Ошибки PRAGMA integrity_check/quick_check; пустой список - копия цела"""
+    pragma = "quick_check" if check == "quick" else "integrity_check"
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute(f"PRAGMA {pragma}")]
+    except sqlite3.Error as e:
+        return [str(e)]
+    finally:
+        conn.close()
+    return [] if problems == ["ok"] else problems
+
+
+def remove_copy(path: str):
+    """Удалить файл копии вместе с -wal/-shm/-journal"""
+    for name in (path,) + tuple(path + suffix for suffix in SIDECARS):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def _locked(backup_dir: str, name: str = LOCK_FILE):
+    """Эксклюзивная блокировка файла в папке копий (ждет, пока ее отпустят)"""
+    with open(os.path.join(backup_dir, name), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> List[Dict]:
+    """Снимки от новых к старым (с итогами из .json, если он есть)"""
+    if not os.path.isdir(backup_dir):
+        return []
+    result = []
+    for name in sorted(os.listdir(backup_dir), reverse=True):
+        if not (name.startswith(PREFIX) and name.endswith(".db")):
+            continue
+        path = os.path.join(backup_dir, name)
+        info = {"file": name, "bytes": os.path.getsize(path)}
+        try:
+            with open(path[:-3] + ".json", encoding="utf-8") as f:
+                info.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        result.append(info)
+    return result
+
+
+def prune(backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> int:
+    """Удалить все снимки, кроме keep последних"""
+    removed = 0
+    for info in list_backups(backup_dir)[keep:]:
+        path = os.path.join(backup_dir, info["file"])
+        remove_copy(path)
+        try:
+            os.remove(path[:-3] + ".json")
+        except FileNotFoundError:
+            pass
+        removed += 1
+    return removed
+
+
+def snapshot(db_name=DB_PATH, backup_dir: str = BACKUP_DIR, mode: str = BACKUP_MODE, keep: int = BACKUP_KEEP,
+             check: str = BACKUP_CHECK, force: bool = False) -> Optional[Dict]:
+    """Снять, проверить и сохранить копию; итоги снимка или None при ошибке.
+    Если база не менялась с прошлого снимка (и не force) - {"skipped": True, ...}"""
+    os.makedirs(backup_dir, exist_ok=True)
+    # Снимок другого процесса сначала завершится: его результат виден в previous
+    with _locked(backup_dir):
+        return _snapshot(db_name, backup_dir, mode, keep, check, force)
+
+
+def _snapshot(db_name, backup_dir: str, mode: str, keep: int, check: str, force: bool) -> Optional[Dict]:
+    stamp = change_stamp(db_name)
+    previous = list_backups(backup_dir)
+    if not force and previous and previous[0].get("stamp") == stamp:
+        return {"skipped": True, "file": previous[0]["file"]}
+
+    now = datetime.now(timezone.utc)
+    # Миллисекунды в имени: два снимка за одну секунду не затирают друг друга
+    name = f"{PREFIX}{now.strftime('%Y%m%d-%H%M%S')}-{now.microsecond // 1000:03d}.db"
+    path = os.path.join(backup_dir, name)
+    tmp = path + ".tmp"
+    started = time.perf_counter()
+    steps = 0
+    try:
+        remove_copy(tmp)
+        if mode == "vacuum":
+            copy_vacuum(db_name, tmp)
+        else:
+            steps = copy_online(db_name, tmp)
+        copied = time.perf_counter() - started
+        problems = verify(tmp, check) if check != "off" else []
+        if problems:
+            print(f"Error verifying backup {name}: {'; '.join(problems[:5])}")
+            remove_copy(tmp)
+            return None
+        os.replace(tmp, path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error backing up {db_name}: {e}")
+        remove_copy(tmp)
+        return None
+
+    info = {
+        "file": name,
+        "created_at": now.isoformat(timespec="seconds"),
+        "mode": mode,
+        "bytes": os.path.getsize(path),
+        "steps": steps,
+        "copy_seconds": round(copied, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "check": check,
+        "stamp": stamp,
+    }
+    with open(path[:-3] + ".json", "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    info["pruned"] = prune(backup_dir, keep)
+    return info
+
+
+class BackupScheduler:
+    """Снимки в фоновом потоке: по расписанию (interval > 0) и по запросу trigger().
+    По расписанию снимает только процесс, захвативший .schedule.lock"""
+
+    def __init__(self, db_name=DB_PATH, backup_dir: str = BACKUP_DIR, interval: float = BACKUP_INTERVAL,
+                 mode: str = BACKUP_MODE, keep: int = BACKUP_KEEP):
+        self.db_name = db_name
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.mode = mode
+        self.keep = keep
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._requested: Optional[str] = None
+        self._lock = threading.Lock()
+        self._schedule_lock = None
+
+        self.running = False
+        self.snapshots = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last: Optional[Dict] = None
+        self.last_finished_at = 0.0
+
+    def trigger(self, mode: Optional[str] = None) -> bool:
+        """Запросить снимок вне расписания; False - снимок уже идет"""
+        with self._lock:
+            if self.running or self._requested is not None:
+                return False
+            self._requested = mode or self.mode
+        self._wake.set()
+        return True
+
+    def run_once(self, mode: Optional[str] = None, force: bool = False) -> Optional[Dict]:
+        with self._lock:
+            self.running = True
+        try:
+            info = snapshot(self.db_name, self.backup_dir, mode or self.mode, self.keep, force=force)
+        finally:
+            with self._lock:
+                self.running = False
+        if info is None:
+            self.failures += 1
+        elif info.get("skipped"):
+            self.skipped += 1
+        else:
+            self.snapshots += 1
+            self.last = info
+        self.last_finished_at = time.time()
+        return info
+
+    def owns_schedule(self) -> bool:
+        """Захватить расписание, если его не держит другой процесс"""
+        if fcntl is None or self._schedule_lock is not None:
+            return True
+        os.makedirs(self.backup_dir, exist_ok=True)
+        f = open(os.path.join(self.backup_dir, SCHEDULE_LOCK_FILE), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._schedule_lock = f
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            with self._lock:
+                requested, self._requested = self._requested, None
+            if requested is None and not self.owns_schedule():
+                # Расписание ведет другой воркер
+                continue
+            # Снимок по запросу делается, даже если база не менялась
+            self.run_once(requested, force=requested is not None)
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="backup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._schedule_lock is not None:
+            self._schedule_lock.close()
+            self._schedule_lock = None
+
+    def stats(self) -> Dict:
+        last = self.last or {}
+        return {
+            "running": int(self.running),
+            "schedule_owner": int(self._schedule_lock is not None),
+            "snapshots": self.snapshots,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_bytes": last.get("bytes", 0),
+            "last_seconds": last.get("seconds", 0),
+            "last_finished_at": self.last_finished_at,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR)
+    parser.add_argument("--mode", choices=("backup", "vacuum"), default=BACKUP_MODE)
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    parser.add_argument("--check", choices=("quick", "full", "off"), default=BACKUP_CHECK)
+    parser.add_argument("--force", action="store_true", help="снять копию, даже если база не менялась")
+    parser.add_argument("--list", action="store_true", help="показать снимки")
+    parser.add_argument("--verify", metavar="FILE", help="полная проверка целостности копии")
+    args = parser.parse_args()
+
+    if args.list:
+        for info in list_backups(args.dir):
+            print(f"{info['file']:<28} {info['bytes']:>12} {info.get('mode', '?'):>7} "
+                  f"{info.get('seconds', 0):>8.2f}s {info.get('created_at', '')}")
+        return
+    if args.verify:
+        problems = verify(args.verify)
+        print("ok" if not problems else "\n".join(problems))
+        if problems:
+            raise SystemExit(1)
+        return
+
+    info = snapshot(args.db, args.dir, args.mode, args.keep, args.check, args.force)
+    if info is None:
+        raise SystemExit(1)
+    if info.get("skipped"):
+        print(f"{args.db} has not changed since {info['file']}, use --force to copy it anyway")
+        return
+    print(f"{info['file']}: {info['bytes']} bytes in {info['seconds']:.2f}s ({args.mode}, {info['steps']} steps), "
+          f"{info['pruned']} old snapshots removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Чтения /voices на фоне записей истории просмотров.
+
+Сравнивает прежнюю схему (журнал отката, у каждого потока свое соединение)
+с профилем WAL + единственный писатель + читающие соединения только для чтения.
+
+    python benchmarks/bench_concurrency.py --seconds 5 --readers 8 --writers 4
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datebase import (Database, ConnectionPool, Writer,  # noqa: E402
+                      DEFAULT_PROFILE, LEGACY_PROFILE)
+
+
+def seed(db_name, profile, users=200, comments=2000):
+    db = Database(db_name, profile=profile)
+    db.cur.executemany(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        [(f"user{i}", f"user{i}@example.kz", "secret") for i in range(users)]
+    )
+    db.cur.executemany(
+        "INSERT INTO comments (user_id, first_name, last_name, comment) VALUES (?, ?, ?, ?)",
+        [(random.randint(1, users), "Аты", "Жөні", "Пікір " * 20) for _ in range(comments)]
+    )
+    db.conn.commit()
+    db.close()
+
+
+def run(mode, args):
+    tmp = tempfile.mkdtemp()
+    db_name = os.path.join(tmp, "advice.db")
+    profile = DEFAULT_PROFILE if mode == "wal" else LEGACY_PROFILE
+    seed(db_name, profile)
+
+    if mode == "wal":
+        writer = Writer(db_name, profile)
+        pool = ConnectionPool(db_name, size=args.readers + args.writers, profile=profile, readonly=True)
+
+        def open_reader():
+            return Database(pool=pool, writer=writer)
+
+        def open_writer():
+            return Database(pool=pool, writer=writer)
+    else:
+        writer = pool = None
+
+        def open_reader():
+            return Database(db_name, profile=profile)
+
+        open_writer = open_reader
+
+    stop = threading.Event()
+    read_latencies = []
+    write_latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def reader():
+        db = open_reader()
+        local = []
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    db.get_all_comments()
+                except sqlite3.OperationalError as e:
+                    errors.append(str(e))
+                    continue
+                local.append(time.perf_counter() - started)
+        finally:
+            db.close()
+        with lock:
+            read_latencies.extend(local)
+
+    def writer_loop():
+        db = open_writer()
+        local = []
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                ok = db.add_view_history(random.randint(1, 200), "exercise", random.randint(1, 6), "1.1 тыныс алу")
+                if not ok:
+                    errors.append("write failed")
+                local.append(time.perf_counter() - started)
+        finally:
+            db.close()
+        with lock:
+            write_latencies.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer_loop) for _ in range(args.writers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    if pool is not None:
+        pool.close()
+        writer.close()
+
+    def pct(values, q):
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+    print(f"[{mode}] reads={len(read_latencies)} ({len(read_latencies) / args.seconds:.0f}/s) "
+          f"p50={pct(read_latencies, 0.5):.2f}ms p99={pct(read_latencies, 0.99):.2f}ms "
+          f"max={pct(read_latencies, 1.0):.2f}ms")
+    print(f"[{mode}] writes={len(write_latencies)} ({len(write_latencies) / args.seconds:.0f}/s) "
+          f"median={statistics.median(write_latencies or [0]) * 1000:.2f}ms errors={len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+    for mode in ("legacy", "wal"):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Пропускная способность /login при одновременных попытках входа.
+
+Запускает приложение в процессе (httpx.AsyncClient + ASGITransport) на копии
+БД, параллельно выполняет входы и одновременно замеряет задержку дешевой
+страницы /login, чтобы показать, что хэширование не блокирует event loop.
+Нужен httpx: pip install httpx
+
+    python benchmarks/bench_login.py --users 50 --logins 400 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+DB_DIR = tempfile.mkdtemp()
+os.environ["SHAMSHYRAQ_DB"] = os.path.join(DB_DIR, "advice.db")
+# Все входы идут с одного адреса - замеряем сам вход, а не ограничитель
+os.environ.setdefault("SHAMSHYRAQ_RATE_LIMIT", "0")
+os.environ.setdefault("SHAMSHYRAQ_CONCURRENCY_AUTH", "100000")
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+async def run(args):
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(args.users):
+                await client.post("/register", data={
+                    "name": f"user{i}", "email": f"user{i}@example.kz", "password": "secret123"
+                })
+
+            latencies = []
+            probe = []
+            done = asyncio.Event()
+            queue = asyncio.Queue()
+            for i in range(args.logins):
+                queue.put_nowait(i)
+
+            async def login_worker():
+                while True:
+                    try:
+                        i = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    started = time.perf_counter()
+                    r = await client.post("/login", data={
+                        "email": f"user{i % args.users}@example.kz", "password": "secret123"
+                    })
+                    assert r.status_code == 302, r.status_code
+                    latencies.append(time.perf_counter() - started)
+
+            async def probe_worker():
+                while not done.is_set():
+                    started = time.perf_counter()
+                    await client.get("/login")
+                    probe.append(time.perf_counter() - started)
+                    await asyncio.sleep(0.01)
+
+            prober = asyncio.create_task(probe_worker())
+            started = time.perf_counter()
+            await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await prober
+
+    print(f"logins={args.logins} concurrency={args.concurrency} "
+          f"throughput={args.logins / elapsed:.1f}/s "
+          f"p50={pct(latencies, 0.5):.1f}ms p95={pct(latencies, 0.95):.1f}ms p99={pct(latencies, 0.99):.1f}ms")
+    print(f"GET /login during the storm: n={len(probe)} "
+          f"p50={pct(probe, 0.5):.1f}ms p99={pct(probe, 0.99):.1f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+"""Время полнотекстового поиска (FTS5) при росте таблицы comments.
+
+Заполняет временную БД комментариями из казахских слов с частотами по закону
+Ципфа и замеряет Database.search для редких, средних и частых слов, а для
+сравнения - прежний способ (LIKE '%слово%' по всей таблице).
+
+    python benchmarks/bench_search.py --sizes 100000 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datebase import Database, DEFAULT_PROFILE  # noqa: E402
+
+SYLLABLES = ["қа", "ба", "жа", "та", "са", "ма", "на", "ла", "ра", "ке", "бе", "ге", "те", "ұл", "үй",
+             "ән", "өз", "ің", "ды", "ді", "лы", "сы", "ғы", "мы", "ша", "тұ", "құ", "жү", "көң", "ір"]
+VOCABULARY_SIZE = 20000
+
+
+def vocabulary():
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(random.choices(SYLLABLES, k=random.randint(2, 4))))
+    return sorted(words, key=lambda w: random.random())
+
+
+def fill(db, words, cum_weights, start, stop):
+    def rows():
+        for n in range(start, stop):
+            text = " ".join(random.choices(words, cum_weights=cum_weights, k=random.randint(5, 30)))
+            yield (n % 1000 + 1, "Аты", "Жөні", text, f"2025-01-{n % 28 + 1:02d} 12:00:00")
+
+    db.cur.executemany(
+        "INSERT INTO comments (user_id, first_name, last_name, comment, created_at) VALUES (?, ?, ?, ?, ?)",
+        rows()
+    )
+    db.conn.commit()
+
+
+def measure(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--like-queries", type=int, default=5, help="запросов LIKE (они медленные)")
+    args = parser.parse_args()
+
+    random.seed(1)
+    words = vocabulary()
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    # Частые - из первой сотни, средние - около тысячного места, редкие - из хвоста
+    classes = {
+        "frequent": words[:100],
+        "medium": words[1000:1500],
+        "rare": words[-5000:],
+    }
+
+    db = Database(os.path.join(tempfile.mkdtemp(), "advice.db"), profile=DEFAULT_PROFILE)
+    loaded = 0
+    print(f"{'rows':>10} {'words':>9} {'fts p50 ms':>11} {'fts p95 ms':>11} {'like p50 ms':>12}")
+    for size in sorted(args.sizes):
+        started = time.perf_counter()
+        fill(db, words, cum_weights, loaded, size)
+        loaded = size
+        db.cur.execute("INSERT INTO comments_fts (comments_fts) VALUES ('optimize')")
+        db.conn.commit()
+        print(f"# {size} comments loaded and indexed in {time.perf_counter() - started:.1f}s")
+
+        for name, pool in classes.items():
+            queries = [random.choice(pool) for _ in range(args.queries)]
+            p50, p95 = measure(lambda q: db.search(q, "comments"), queries)
+
+            def like(q):
+                db.cur.execute(
+                    "SELECT * FROM comments WHERE comment LIKE ? ORDER BY created_at DESC LIMIT 20", (f"%{q}%",)
+                )
+                db.cur.fetchall()
+
+            like_p50, _ = measure(like, queries[:args.like_queries])
+            print(f"{size:>10} {name:>9} {p50 * 1000:>11.3f} {p95 * 1000:>11.3f} {like_p50 * 1000:>12.3f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Первый запрос после старта воркера: без кэша шаблонов, с байткодом на диске и с прогревом.
+
+Каждый режим запускается в отдельном процессе (как свежий воркер) на копии
+БД: замеряется время старта (lifespan) и время первого и повторного запроса
+к каждой странице. Нужен httpx: pip install httpx
+
+    python benchmarks/bench_templates.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PAGES = ["/", "/hope", "/exercise", "/exercise/1", "/advice", "/advice/1", "/voices", "/history",
+         "/search?q=жаттығу", "/about", "/breathing", "/calm"]
+
+# режим -> (кэш байткода заполнен заранее, прогрев при старте)
+MODES = {
+    "cold": (False, False),
+    "bytecode": (True, False),
+    "warmup": (False, True),
+    "bytecode+warmup": (True, True),
+}
+
+
+async def child():
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import httpx
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        startup = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/register", data={"name": "Bench", "email": "bench@bench.kz", "password": "bench123"})
+            await client.post("/login", data={"email": "bench@bench.kz", "password": "bench123"})
+            first, second = {}, {}
+            for timings in (first, second):
+                for page in PAGES:
+                    request_started = time.perf_counter()
+                    response = await client.get(page)
+                    timings[page] = time.perf_counter() - request_started
+                    assert response.status_code == 200, (page, response.status_code)
+    print(json.dumps({"startup": startup, "first": first, "second": second}))
+
+
+def run_mode(db_path, cache_dir, prefill, warmup):
+    workdir = tempfile.mkdtemp()
+    db = os.path.join(workdir, "advice.db")
+    shutil.copy(db_path, db)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    if prefill:
+        subprocess.run([sys.executable, "template_cache.py", "--cache-dir", cache_dir],
+                       cwd=ROOT, check=True, capture_output=True)
+    env = dict(os.environ, SHAMSHYRAQ_DB=db, SHAMSHYRAQ_DATA_DIR=workdir,
+               SHAMSHYRAQ_TEMPLATE_CACHE=cache_dir if prefill else "",
+               SHAMSHYRAQ_TEMPLATE_WARMUP="1" if warmup else "0")
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    shutil.rmtree(workdir, ignore_errors=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db", default=os.path.join(ROOT, "data", "advice.db"))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child())
+        return
+
+    cache_dir = os.path.join(tempfile.mkdtemp(), "template_cache")
+    print(f"{'mode':>16} {'startup ms':>11} {'first p50':>10} {'first max':>10} {'first sum':>10} {'warm p50':>9}")
+    for mode, (prefill, warmup) in MODES.items():
+        runs = [run_mode(args.db, cache_dir, prefill, warmup) for _ in range(args.runs)]
+        startup = statistics.median(r["startup"] for r in runs)
+        first = {page: statistics.median(r["first"][page] for r in runs) for page in PAGES}
+        second = {page: statistics.median(r["second"][page] for r in runs) for page in PAGES}
+        print(f"{mode:>16} {startup * 1000:>11.1f} {statistics.median(first.values()) * 1000:>10.2f} "
+              f"{max(first.values()) * 1000:>10.2f} {sum(first.values()) * 1000:>10.1f} "
+              f"{statistics.median(second.values()) * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Время запросов истории просмотров при росте таблицы view_history.
+
+Заполняет временную БД до каждого из размеров и замеряет get_view_history
+(ORDER BY viewed_at DESC LIMIT 20) и add_view_history (UPSERT).
+
+    python benchmarks/bench_view_history.py --sizes 100000 1000000 3000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datebase import Database, DEFAULT_PROFILE  # noqa: E402
+
+ITEMS_PER_USER = 50
+
+
+def fill(db, start, stop):
+    """Строки start..stop: у каждого пользователя ITEMS_PER_USER разных материалов"""
+    def rows():
+        for n in range(start, stop):
+            user_id, item = divmod(n, ITEMS_PER_USER)
+            item_type = "exercise" if item % 2 else "advice"
+            day = random.randint(1, 28)
+            yield (user_id + 1, item_type, item, f"Материал {item}",
+                   f"2025-01-{day:02d} {random.randint(0, 23):02d}:{random.randint(0, 59):02d}:00")
+
+    db.cur.executemany(
+        "INSERT INTO view_history (user_id, item_type, item_id, item_name, viewed_at) VALUES (?, ?, ?, ?, ?)",
+        rows()
+    )
+    db.conn.commit()
+
+
+def measure(db, users, queries):
+    started = time.perf_counter()
+    for _ in range(queries):
+        db.get_view_history(random.randint(1, users))
+    read = (time.perf_counter() - started) / queries
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        db.add_view_history(random.randint(1, users), "exercise", random.randint(0, ITEMS_PER_USER), "Материал")
+    write = (time.perf_counter() - started) / queries
+    return read, write
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = Database(os.path.join(tempfile.mkdtemp(), "advice.db"), profile=DEFAULT_PROFILE)
+    loaded = 0
+    print(f"{'rows':>10} {'history ms':>12} {'upsert ms':>10}")
+    for size in sorted(args.sizes):
+        fill(db, loaded, size)
+        loaded = size
+        db.cur.execute("ANALYZE")
+        read, write = measure(db, size // ITEMS_PER_USER, args.queries)
+        print(f"{size:>10} {read * 1000:>12.3f} {write * 1000:>10.3f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
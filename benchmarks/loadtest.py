@@ -0,0 +1,320 @@
+"""Нагрузочный тест всех маршрутов main.app.
+
+Заполняет временную копию БД до заданных размеров, запускает виртуальных
+пользователей (вход, детальные страницы с записью истории, чтение /voices,
+комментарии и остальные страницы) и выводит p50/p95/p99, RPS и время БД по
+каждому маршруту. Результат сохраняется в JSON для сравнения между коммитами.
+
+По умолчанию приложение работает в этом же процессе (httpx.ASGITransport),
+с --url - против запущенного локально uvicorn. Тогда --db - файл БД этого
+сервера: скрипт дописывает в него пользователей user{N}@loadtest.kz,
+материалы, комментарии и историю (с --no-seed только проверяет, что они уже
+есть) и берет из него настоящие id. Сервер должен работать с
+SHAMSHYRAQ_RATE_LIMIT=0, иначе все клиенты с одного адреса упрутся в лимиты.
+Время БД в обоих случаях берется из заголовка Server-Timing.
+
+Ошибкой считаются 4xx/5xx, неудачный вход и переадресация на /login.
+Нужен httpx: pip install httpx
+
+    python benchmarks/loadtest.py --users 1000 --comments 50000 --history 200000 \\
+        --duration 30 --concurrency 32 --out baseline.json
+    python benchmarks/loadtest.py --duration 30 --compare baseline.json
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --db data/advice.db --no-seed
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+
+PASSWORD = "loadtest123"
+
+# (вес, метод, шаблон маршрута)
+MIX = [
+    (5, "GET", "/"),
+    (10, "GET", "/hope"),
+    (5, "GET", "/exercise"),
+    (15, "GET", "/exercise/{exercise_id}"),
+    (5, "GET", "/advice"),
+    (15, "GET", "/advice/{advice_id}"),
+    (15, "GET", "/voices"),
+    (3, "POST", "/add_comment"),
+    (8, "GET", "/history"),
+    (2, "GET", "/breathing"),
+    (2, "GET", "/muscle"),
+    (2, "GET", "/meditation"),
+    (2, "GET", "/about"),
+    (2, "GET", "/balance"),
+    (2, "GET", "/calm"),
+    (2, "GET", "/emotion"),
+    (2, "GET", "/music"),
+    (2, "GET", "/selfsupport"),
+    (2, "GET", "/time"),
+    (1, "GET", "/login"),
+    (1, "GET", "/register"),
+    (1, "POST", "/login"),
+]
+
+
+def seed(db_name, users, comments, history, items):
+    """Заполнение БД пакетами executemany (один хэш пароля на всех)"""
+    from datebase import Database
+    from passwords import hash_password
+
+    db = Database(db_name)
+    password_hash = hash_password(PASSWORD)
+    cur = db.cur
+    cur.executemany(
+        "INSERT INTO exercise (name, description, video_url) VALUES (?, ?, ?)",
+        [(f"Жаттығу {i}", "Сипаттама " * 40, "1.2.mp4") for i in range(items)]
+    )
+    cur.executemany(
+        "INSERT INTO advice (name, content, video_url) VALUES (?, ?, ?)",
+        [(f"Кеңес {i}", "Мазмұны " * 40, "1.1.mp4") for i in range(items)]
+    )
+    cur.executemany(
+        "INSERT OR IGNORE INTO users (name, email, password) VALUES (?, ?, ?)",
+        ((f"Қолданушы {i}", f"user{i}@loadtest.kz", password_hash) for i in range(users))
+    )
+    cur.execute("SELECT id FROM users WHERE email LIKE '%@loadtest.kz' ORDER BY id")
+    user_ids = [row["id"] for row in cur.fetchall()]
+    cur.execute("SELECT id FROM exercise")
+    exercise_ids = [row["id"] for row in cur.fetchall()]
+    cur.execute("SELECT id FROM advice")
+    advice_ids = [row["id"] for row in cur.fetchall()]
+
+    cur.executemany(
+        "INSERT INTO comments (user_id, first_name, last_name, comment, created_at) VALUES (?, ?, ?, ?, ?)",
+        ((random.choice(user_ids), "Аты", "Жөні", "Пікір " * random.randint(5, 40),
+          f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:{random.randint(0, 59):02d}")
+         for _ in range(comments))
+    )
+
+    # Уникальные (user_id, item_type, item_id) подряд по пользователям
+    items_per_user = len(exercise_ids) + len(advice_ids)
+    catalog = [("exercise", i) for i in exercise_ids] + [("advice", i) for i in advice_ids]
+    history = min(history, len(user_ids) * items_per_user)
+    cur.executemany(
+        "INSERT OR IGNORE INTO view_history (user_id, item_type, item_id, item_name, viewed_at) VALUES (?, ?, ?, ?, ?)",
+        ((user_ids[n // items_per_user], *catalog[n % items_per_user], "Материал",
+          f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 10:00:00")
+         for n in range(history))
+    )
+    db.conn.commit()
+    db.close()
+
+
+def load_ids(db_name):
+    """Email пользователей нагрузочного теста и id материалов из БД"""
+    import sqlite3
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_name)}?mode=ro", uri=True)
+    try:
+        emails = [row[0] for row in conn.execute("SELECT email FROM users WHERE email LIKE '%@loadtest.kz'")]
+        exercise_ids = [row[0] for row in conn.execute("SELECT id FROM exercise")]
+        advice_ids = [row[0] for row in conn.execute("SELECT id FROM advice")]
+    finally:
+        conn.close()
+    if not emails or not exercise_ids or not advice_ids:
+        raise SystemExit(f"{db_name} has no load test users or items, run without --no-seed first")
+    return emails, exercise_ids, advice_ids
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.db_times = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, route, elapsed, response):
+        self.latencies[route].append(elapsed)
+        if not self.succeeded(route, response):
+            self.errors[route] += 1
+            return
+        timing = response.headers.get("server-timing", "")
+        for part in timing.split(","):
+            name, _, params = part.strip().partition(";")
+            if name == "db" and "dur=" in params:
+                self.db_times[route].append(float(params.split("dur=")[1].split(";")[0]) / 1000)
+
+    @staticmethod
+    def succeeded(route, response):
+        """Вход удался - переадресация на /; остальное - без 4xx/5xx и без переадресации на /login"""
+        if response is None or response.status_code >= 400:
+            return False
+        location = response.headers.get("location", "")
+        if route == "POST /login":
+            return response.is_redirect and location == "/"
+        return not (response.is_redirect and location.endswith("/login"))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def virtual_user(client_factory, recorder, deadline, emails, exercise_ids, advice_ids):
+    weights = [route[0] for route in MIX]
+    email = random.choice(emails)
+
+    async with client_factory() as client:
+        started = time.perf_counter()
+        r = await client.post("/login", data={"email": email, "password": PASSWORD})
+        recorder.add("POST /login", time.perf_counter() - started, r)
+
+        while time.perf_counter() < deadline:
+            _, method, template = random.choices(MIX, weights)[0]
+            path = template.format(
+                exercise_id=random.choice(exercise_ids),
+                advice_id=random.choice(advice_ids),
+            )
+            kwargs = {}
+            if method == "POST" and template == "/add_comment":
+                kwargs["data"] = {"first_name": "Жүктеме", "last_name": "Тест",
+                                  "comment": "Жүктеме тестінің пікірі"}
+            elif method == "POST" and template == "/login":
+                kwargs["data"] = {"email": email, "password": PASSWORD}
+
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, path, **kwargs)
+            except httpx.HTTPError:
+                r = None
+            recorder.add(f"{method} {template}", time.perf_counter() - started, r)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(recorder, duration, args):
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        db_values = recorder.db_times.get(route, [])
+        routes[route] = {
+            "count": len(values),
+            "errors": recorder.errors.get(route, 0),
+            "rps": len(values) / duration,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "mean_ms": sum(values) / len(values) * 1000,
+            "db_mean_ms": sum(db_values) / len(db_values) * 1000 if db_values else None,
+        }
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "mode": "url" if args.url else "in-process",
+            "users": args.users,
+            "comments": args.comments,
+            "history": args.history,
+            "items": args.items,
+            "duration": duration,
+            "concurrency": args.concurrency,
+        },
+        "total": {"count": total, "rps": total / duration},
+        "routes": routes,
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"{'route':<32} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'db':>7} {'err':>5}")
+    for route, r in result["routes"].items():
+        db = f"{r['db_mean_ms']:.2f}" if r["db_mean_ms"] is not None else "-"
+        line = (f"{route:<32} {r['count']:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} "
+                f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {db:>7} {r['errors']:>5}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p95_ms"]:
+            line += f"   p95 {100 * (r['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.1f}%"
+        print(line)
+    print(f"total: {result['total']['count']} requests, {result['total']['rps']:.1f} rps")
+
+
+async def run(args):
+    if args.url:
+        if not args.no_seed:
+            seed(args.db, args.users, args.comments, args.history, args.items)
+        emails, exercise_ids, advice_ids = load_ids(args.db)
+
+        def client_factory():
+            return httpx.AsyncClient(base_url=args.url, timeout=30)
+
+        app_context = None
+    else:
+        db_name = os.path.join(tempfile.mkdtemp(), "advice.db")
+        os.environ["SHAMSHYRAQ_DB"] = db_name
+        os.environ.setdefault("SHAMSHYRAQ_BUILD_ASSETS", "0")
+        # Все клиенты на одном адресе: без ограничения частоты, одновременность - как в бою
+        os.environ.setdefault("SHAMSHYRAQ_RATE_LIMIT", "0")
+        os.chdir(ROOT)
+        seed(db_name, args.users, args.comments, args.history, args.items)
+        emails, exercise_ids, advice_ids = load_ids(db_name)
+
+        import main
+        app_context = main.lifespan(main.app)
+        await app_context.__aenter__()
+        transport = httpx.ASGITransport(app=main.app)
+
+        def client_factory():
+            return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=30)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    try:
+        await asyncio.gather(*(
+            virtual_user(client_factory, recorder, deadline, emails, exercise_ids, advice_ids)
+            for _ in range(args.concurrency)
+        ))
+    finally:
+        if app_context is not None:
+            await app_context.__aexit__(None, None, None)
+    return summarize(recorder, time.perf_counter() - started, args)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--comments", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=20, help="сколько упражнений и советов добавить")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--url", help="адрес запущенного сервера вместо приложения в процессе")
+    parser.add_argument("--db", help="файл БД сервера из --url: заполнить его и взять из него id")
+    parser.add_argument("--no-seed", action="store_true", help="с --url: БД уже заполнена, только проверить")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="сохранить результат в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+    if args.url and not args.db:
+        parser.error("--url needs --db with the server's database file")
+
+    random.seed(args.seed)
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,276 @@
+"""Потоковый импорт/экспорт таблиц advice.db в CSV и JSONL.
+
+Память не зависит от размера файла: строки читаются и пишутся пачками.
+Импорт идет пачками executemany, каждая пачка - одна транзакция вместе с
+отметкой о прогрессе (таблица import_progress), поэтому после сбоя повторный
+запуск продолжает с места остановки. На время загрузки неуникальные индексы
+и триггеры таблицы удаляются (их SQL сохраняется в import_progress), затем
+создаются заново, а новые строки добавляются в поисковый индекс одним запросом.
+Уникальные индексы остаются: приложение может работать во время загрузки, и
+его ON CONFLICT опирается на них. Просмотры (view_history) загружаются так же,
+как их пишет приложение: повторный просмотр обновляет запись, и каждый
+попадает в view_events - а значит, в дневные сводки, популярное за неделю и
+серии дней.
+
+    python bulk.py export comments comments.csv
+    python bulk.py export view_history history.jsonl
+    python bulk.py import comments comments.csv
+    python bulk.py import view_history history.jsonl --restart
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from typing import Optional, Dict, List, Iterator, Tuple
+
+from datebase import DB_PATH, DEFAULT_PROFILE, Database, connect
+from migrations import dedupe_view_history
+
+TABLES = ("users", "exercise", "advice", "comments", "view_history")
+CHUNK_SIZE = int(os.environ.get("SHAMSHYRAQ_BULK_CHUNK", "50000"))
+
+# Повторный просмотр обновляет запись, как VIEW_HISTORY_UPSERT, но более старый ее не затирает
+VIEW_HISTORY_CONFLICT = """
+    ON CONFLICT (user_id, item_type, item_id)
+    DO UPDATE SET item_name = excluded.item_name, viewed_at = excluded.viewed_at
+    WHERE excluded.viewed_at >= view_history.viewed_at
+"""
+VIEW_EVENT_FIELDS = ("user_id", "item_type", "item_id", "viewed_at")
+VIEW_EVENTS_IMPORT = """
+    INSERT INTO view_events (user_id, item_type, item_id, viewed_at)
+    VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+"""
+
+
+def _format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> Dict[str, bool]:
+    """Колонка -> допускает ли NULL"""
+    return {row["name"]: not row["notnull"] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def export_table(table: str, path: str, fmt: Optional[str] = None, db_name=DB_PATH) -> int:
+    fmt = _format(path, fmt)
+    conn = connect(db_name, readonly=True)
+    rows = 0
+    try:
+        cur = conn.execute(f"SELECT * FROM {table} ORDER BY id")
+        columns = [d[0] for d in cur.description]
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f) if fmt == "csv" else None
+            if writer is not None:
+                writer.writerow(columns)
+            while True:
+                chunk = cur.fetchmany(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if writer is not None:
+                    writer.writerows(chunk)
+                else:
+                    f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in chunk)
+                rows += len(chunk)
+    finally:
+        conn.close()
+    return rows
+
+
+class _Lines:
+    """Строки бинарного файла с учетом позиции: offset - конец последней отданной строки"""
+
+    def __init__(self, f, offset: int):
+        f.seek(offset)
+        self.f = f
+        self.offset = offset
+
+    def __iter__(self) -> Iterator[str]:
+        for raw in self.f:
+            self.offset += len(raw)
+            yield raw.decode("utf-8")
+
+
+def _read_records(f, fmt: str, offset: int, columns: Optional[List[str]]) -> Iterator[Tuple[List[str], list, int]]:
+    """(колонки, значения, позиция после записи)"""
+    lines = _Lines(f, offset)
+    if fmt == "csv":
+        reader = csv.reader(lines)
+        if columns is None:
+            columns = [c.lstrip("﻿") for c in next(reader)]
+            yield columns, None, lines.offset
+        for values in reader:
+            if values:
+                yield columns, values, lines.offset
+    else:
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield list(record), list(record.values()), lines.offset
+
+
+def _defer_indexes(conn: sqlite3.Connection, table: str, source: str) -> List[List[str]]:
+    """Удалить неуникальные индексы и триггеры таблицы, запомнив их SQL в import_progress"""
+    unique = {row["name"] for row in conn.execute(f"PRAGMA index_list({table})") if row["unique"]}
+    objects = [list(row) for row in conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)
+    ) if row["name"] not in unique]
+    with conn:
+        for object_type, name, _ in objects:
+            conn.execute(f"DROP {object_type.upper()} IF EXISTS {name}")
+        conn.execute("UPDATE import_progress SET deferred = ? WHERE source = ?", (json.dumps(objects), source))
+    return objects
+
+
+def _restore_indexes(conn: sqlite3.Connection, table: str, objects: List[List[str]]):
+    """Создать заново удаленные _defer_indexes индексы и триггеры (пропуская уже созданные)"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = ?", (table,))}
+    with conn:
+        if table == "view_history" and "idx_view_history_item" not in existing:
+            # Загрузка прежней версии удаляла и уникальный индекс - он не создастся, если были повторы
+            dedupe_view_history(conn.cursor())
+        for _, name, sql in objects:
+            if name not in existing:
+                conn.execute(sql)
+
+
+def import_table(table: str, path: str, fmt: Optional[str] = None, db_name=DB_PATH,
+                 chunk_size: int = CHUNK_SIZE, restart: bool = False) -> bool:
+    fmt = _format(path, fmt)
+    # Схема и служебные таблицы (import_progress) должны существовать
+    Database(db_name).close()
+    conn = connect(db_name, DEFAULT_PROFILE)
+    # Тот же файл (путь и размер) продолжает прежнюю загрузку
+    source = f"{table}:{os.path.abspath(path)}:{os.path.getsize(path)}"
+    if restart:
+        previous = conn.execute("SELECT deferred FROM import_progress WHERE source = ?", (source,)).fetchone()
+        if previous is not None and previous["deferred"] is not None:
+            # Прерванная загрузка: сначала вернуть удаленные ею индексы
+            _restore_indexes(conn, table, json.loads(previous["deferred"]))
+        conn.execute("DELETE FROM import_progress WHERE source = ?", (source,))
+    progress = conn.execute("SELECT * FROM import_progress WHERE source = ?", (source,)).fetchone()
+    if progress is not None and progress["finished"]:
+        print(f"{path} is already imported into {table} ({progress['rows']} rows), use --restart to load it again")
+        conn.close()
+        return True
+    if progress is None:
+        first_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        conn.execute(
+            "INSERT INTO import_progress (source, table_name, first_id) VALUES (?, ?, ?)", (source, table, first_id)
+        )
+        conn.commit()
+        progress = conn.execute("SELECT * FROM import_progress WHERE source = ?", (source,)).fetchone()
+    else:
+        print(f"Resuming {table} from row {progress['rows']}")
+
+    known = _columns(conn, table)
+    columns = json.loads(progress["columns"]) if progress["columns"] else None
+    rows = progress["rows"]
+    started = time.perf_counter()
+    # При продолжении индексы уже удалены прошлым запуском
+    if progress["deferred"] is None:
+        deferred = _defer_indexes(conn, table, source)
+    else:
+        deferred = json.loads(progress["deferred"])
+
+    def store(batch, offset):
+        # Пачка, ее события просмотров и отметка о прогрессе в одной транзакции
+        with conn:
+            conn.executemany(sql, batch)
+            if table == "view_history":
+                conn.executemany(VIEW_EVENTS_IMPORT, [
+                    [values[i] if i is not None else None for i in event_fields] for values in batch
+                ])
+            conn.execute(
+                "UPDATE import_progress SET columns = ?, offset = ?, rows = ? WHERE source = ?",
+                (json.dumps(columns), offset, rows, source)
+            )
+
+    try:
+        with open(path, "rb") as f:
+            sql = None
+            batch = []
+            offset = previous_offset = progress["offset"]
+            for record_columns, values, offset in _read_records(f, fmt, progress["offset"], columns):
+                if sql is None or record_columns != columns:
+                    unknown = [c for c in record_columns if c not in known]
+                    if unknown:
+                        raise ValueError(f"unknown columns for {table}: {', '.join(unknown)}")
+                    if batch:
+                        store(batch, previous_offset)
+                        batch = []
+                    columns = record_columns
+                    nullable = [known[c] for c in columns]
+                    sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                           f"VALUES ({', '.join('?' for _ in columns)})")
+                    if table == "view_history":
+                        sql += VIEW_HISTORY_CONFLICT
+                        event_fields = [columns.index(c) if c in columns else None for c in VIEW_EVENT_FIELDS]
+                if values is None:
+                    continue
+                if fmt == "csv":
+                    # Пустая строка CSV - это NULL там, где он допустим
+                    values = [None if v == "" and null else v for v, null in zip(values, nullable)]
+                batch.append(values)
+                rows += 1
+                previous_offset = offset
+                if len(batch) >= chunk_size:
+                    store(batch, offset)
+                    batch = []
+            if batch:
+                store(batch, offset)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error importing {path} into {table} at row {rows}: {e}")
+        conn.close()
+        return False
+
+    loaded = time.perf_counter() - started
+
+    # Индексы, триггеры и поиск - после загрузки
+    try:
+        _restore_indexes(conn, table, deferred)
+    except sqlite3.Error as e:
+        print(f"Error restoring indexes of {table}: {e}")
+        conn.close()
+        return False
+    conn.close()
+    db = Database(db_name)
+    try:
+        indexed = db.index_search_rows(table, progress["first_id"])
+        db.bump_table_version(table)
+        with db._write() as cur:
+            cur.execute("UPDATE import_progress SET finished = 1, deferred = NULL WHERE source = ?", (source,))
+    finally:
+        db.close()
+    rebuilt = time.perf_counter() - started - loaded
+    print(f"{table}: {rows} rows loaded in {loaded:.1f}s, indexes rebuilt in {rebuilt:.1f}s"
+          + (f", {indexed} rows added to search" if indexed else ""))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="по умолчанию - по расширению файла")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="строк в одной транзакции")
+    parser.add_argument("--restart", action="store_true", help="загрузить файл заново, а не продолжать")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        started = time.perf_counter()
+        rows = export_table(args.table, args.path, args.format, args.db)
+        print(f"{args.table}: {rows} rows exported in {time.perf_counter() - started:.1f}s")
+    elif not import_table(args.table, args.path, args.format, args.db, args.chunk, args.restart):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Dict, List, Set, Tuple, Callable, Awaitable, AsyncIterator
+
+COMMENT_FEED_BACKLOG = int(os.environ.get("SHAMSHYRAQ_COMMENT_FEED_BACKLOG", "200"))
+COMMENT_FEED_QUEUE = int(os.environ.get("SHAMSHYRAQ_COMMENT_FEED_QUEUE", "100"))
+# Как часто проверять комментарии, добавленные другими воркерами
+COMMENT_FEED_POLL_INTERVAL = float(os.environ.get("SHAMSHYRAQ_COMMENT_FEED_POLL_INTERVAL", "1.0"))
+COMMENT_FEED_HEARTBEAT = float(os.environ.get("SHAMSHYRAQ_COMMENT_FEED_HEARTBEAT", "15"))
+# Через сколько мс браузер переподключается к ленте
+COMMENT_FEED_RETRY_MS = 3000
+
+PUBLIC_FIELDS = ("id", "first_name", "last_name", "comment", "created_at", "user_name")
+
+
+class CommentFeed:
+    """Лента новых комментариев для Server-Sent Events.
+
+    Каждый комментарий форматируется в событие один раз и раздается всем
+    подписчикам процесса через их очереди. Последние события хранятся в
+    backlog, чтобы переподключившийся клиент (Last-Event-ID) получил
+    пропущенное; более старые догружаются из БД. Комментарии других
+    воркеров подхватываются периодическим опросом БД; без подписчиков
+    опрос только сдвигает позицию на последний id, чтобы после простоя
+    старые комментарии не пришли как новые. Клиент получает события
+    строго по возрастанию id.
+    """
+
+    def __init__(self, render: Optional[Callable[[Dict], str]] = None, backlog: int = COMMENT_FEED_BACKLOG,
+                 queue_size: int = COMMENT_FEED_QUEUE, poll_interval: float = COMMENT_FEED_POLL_INTERVAL,
+                 heartbeat: float = COMMENT_FEED_HEARTBEAT):
+        self.render = render
+        self.backlog = backlog
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        # id комментария -> готовое событие
+        self._events: "OrderedDict[int, bytes]" = OrderedDict()
+        # Комментариев с id <= _floor в backlog нет (вытеснены или пропущены без подписчиков)
+        self._floor = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._load_after: Optional[Callable[[int], Awaitable[List[Dict]]]] = None
+        self._load_last_id: Optional[Callable[[], Awaitable[int]]] = None
+        self._poll_id = 0
+        self._task: Optional[asyncio.Task] = None
+
+        self.published = 0
+        self.dropped = 0
+
+    def public(self, comment: Dict) -> Dict:
+        """Поля комментария для клиента (JSON ответа и события)"""
+        data = {field: comment.get(field) for field in PUBLIC_FIELDS}
+        if self.render is not None:
+            data["html"] = self.render(comment)
+        return data
+
+    def _format(self, comment: Dict) -> bytes:
+        data = json.dumps(self.public(comment), ensure_ascii=False, default=str)
+        return f"id: {comment['id']}\nevent: comment\ndata: {data}\n\n".encode("utf-8")
+
+    def publish(self, comment: Dict):
+        """Разослать комментарий подписчикам (вызывать из цикла событий)"""
+        comment_id = comment["id"]
+        if comment_id <= self._floor or comment_id in self._events:
+            return
+        event = self._format(comment)
+        self._events[comment_id] = event
+        while len(self._events) > self.backlog:
+            evicted, _ = self._events.popitem(last=False)
+            self._floor = max(self._floor, evicted)
+        self.published += 1
+
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((comment_id, event))
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: закрываем его поток, он переподключится с Last-Event-ID
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self._subscribers.discard(queue)
+
+    async def _missed(self, last_event_id: int) -> List[Tuple[int, bytes]]:
+        """(id, событие) после last_event_id по возрастанию id"""
+        if last_event_id >= self._floor:
+            return [(comment_id, event) for comment_id, event in sorted(self._events.items())
+                    if comment_id > last_event_id]
+        if self._load_after is None:
+            return []
+        return [(comment["id"], self._format(comment)) for comment in await self._load_after(last_event_id)]
+
+    async def stream(self, last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        # Подписываемся до догрузки пропущенного, чтобы не потерять события между ними
+        self._subscribers.add(queue)
+        try:
+            yield f"retry: {COMMENT_FEED_RETRY_MS}\n\n".encode()
+            # Наибольший отправленный id: все, что не новее, клиент уже получил или пропустил навсегда
+            sent = last_event_id or 0
+            if last_event_id is not None:
+                for comment_id, event in await self._missed(last_event_id):
+                    sent = max(sent, comment_id)
+                    yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                    yield b": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                comment_id, event = event
+                if comment_id > sent:
+                    sent = comment_id
+                    yield event
+        finally:
+            self._subscribers.discard(queue)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if not self._subscribers:
+                    # Раздавать некому: пропускаем все, что уже есть в БД
+                    self._poll_id = max(self._poll_id, await self._load_last_id())
+                    self._floor = max(self._floor, self._poll_id)
+                    continue
+                comments = await self._load_after(self._poll_id)
+            except Exception as e:
+                print(f"Error polling comments: {e}")
+                continue
+            for comment in comments:
+                self._poll_id = max(self._poll_id, comment["id"])
+                self.publish(comment)
+
+    def start(self, load_after: Callable[[int], Awaitable[List[Dict]]],
+              load_last_id: Callable[[], Awaitable[int]], last_id: int):
+        """load_after(id) - комментарии с большим id из БД; load_last_id() - последний id в БД;
+        last_id - последний существующий"""
+        self._load_after = load_after
+        self._load_last_id = load_last_id
+        self._poll_id = last_id
+        self._floor = max(self._floor, last_id)
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        # Закрываем открытые потоки
+        for queue in list(self._subscribers):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        self._subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "backlog": len(self._events),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,192 @@
+import gzip
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli не установлен - только gzip
+    brotli = None
+
+# Ответы меньше этого размера не сжимаются (выигрыш меньше накладных расходов)
+COMPRESS_MIN_SIZE = int(os.environ.get("SHAMSHYRAQ_COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("SHAMSHYRAQ_COMPRESS_GZIP_LEVEL", "6"))
+# Для динамических ответов - быстрый уровень; статика сжата заранее с quality=11
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("SHAMSHYRAQ_COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("text/html", "text/plain", "text/css", "text/javascript", "application/json",
+                      "application/javascript", "image/svg+xml")
+
+_stats = {"responses": 0, "streamed": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br, если браузер его принимает (и пакет установлен), иначе gzip"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def weaken_etag(etag: str) -> str:
+    """Сжатое тело побайтно отличается от исходного: сильный ETag становится слабым"""
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match (RFC 9110): W/"x" и "x" совпадают"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._br = None
+            # wbits=31 - формат gzip
+            self._zlib = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Сжать кусок и вытолкнуть его клиенту сразу (для потоковых ответов)"""
+        if self._br is not None:
+            return self._br.process(data) + self._br.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._br is not None:
+            return self._br.finish()
+        return self._zlib.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Сжатие динамических ответов gzip/brotli по Accept-Encoding.
+
+    Ответ одним телом сжимается целиком, если он не меньше minimum_size.
+    Потоковый ответ (несколько http.response.body) сжимается по кускам без
+    накопления тела: каждый кусок сразу выталкивается клиенту. Не трогаем
+    уже сжатое (статика с Content-Encoding), несжимаемые типы и
+    text/event-stream - события должны доходить без задержки.
+
+    ETag сжатого ответа (и 304 на него) становится слабым: сильный ETag
+    обещает побайтно то же тело, а сжатое тело другое. Кэши страниц и API
+    сравнивают If-None-Match слабо (etag_matches), так что W/ им подходит.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        # Клиент прислал слабый ETag - у него сжатый вариант, и 304 должен повторить W/
+        weak_304 = "W/" in request_headers.get("if-none-match", "")
+
+        start = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                if message["status"] == 304 and weak_304 and "etag" in headers:
+                    MutableHeaders(scope=message)["ETag"] = weaken_etag(headers["etag"])
+                if (message["status"] < 200 or message["status"] in (204, 304)
+                        or "content-encoding" in headers or media_type not in COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(scope=start)
+            if compressor is None:
+                if not more_body:
+                    # Весь ответ одним куском
+                    headers.add_vary_header("Accept-Encoding")
+                    if len(body) < self.minimum_size:
+                        await send(start)
+                        await send(message)
+                        return
+                    compressed = compress(body, encoding)
+                    _stats["responses"] += 1
+                    _count(len(body), len(compressed))
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    if "etag" in headers:
+                        headers["ETag"] = weaken_etag(headers["etag"])
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                # Потоковый ответ: длина заранее неизвестна
+                compressor = _Compressor(encoding)
+                _stats["responses"] += 1
+                _stats["streamed"] += 1
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                if "etag" in headers:
+                    headers["ETag"] = weaken_etag(headers["etag"])
+                await send(start)
+
+            chunk = compressor.chunk(body) if body else b""
+            if not more_body:
+                chunk += compressor.finish()
+            _count(len(body), len(chunk))
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _count(bytes_in: int, bytes_out: int):
+    _stats["bytes_in"] += bytes_in
+    _stats["bytes_out"] += bytes_out
+
+
+def stats() -> dict:
+    return dict(_stats)
@@ -1,81 +1,612 @@
 import sqlite3
 import os
-from typing import Optional, List, Dict
-from datetime import datetime
+import base64
+import binascii
+import hashlib
+import html
+import re
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Tuple, Iterator
+from datetime import datetime, timezone, timedelta
 
+from passwords import verify_password
+from migrations import SEARCH_INDEXES, KAZAKH_FOLD, fold_sql, migrate
 
-class Database:
-    def __init__(self, db_name="data/advice.db"):
+DB_PATH = os.environ.get("SHAMSHYRAQ_DB", "data/advice.db")
+POOL_SIZE = int(os.environ.get("SHAMSHYRAQ_POOL_SIZE", "16"))
+POOL_TIMEOUT = float(os.environ.get("SHAMSHYRAQ_POOL_TIMEOUT", "10"))
+VIEW_BATCH_SIZE = int(os.environ.get("SHAMSHYRAQ_VIEW_BATCH_SIZE", "200"))
+VIEW_FLUSH_INTERVAL = float(os.environ.get("SHAMSHYRAQ_VIEW_FLUSH_INTERVAL", "1.0"))
+CATALOG_CHECK_INTERVAL = float(os.environ.get("SHAMSHYRAQ_CATALOG_CHECK_INTERVAL", "1.0"))
+# Срок хранения журнала просмотров (view_events) и дневных сводок, в днях
+VIEW_EVENTS_RETENTION_DAYS = int(os.environ.get("SHAMSHYRAQ_VIEW_EVENTS_RETENTION_DAYS", "90"))
+VIEW_ROLLUP_RETENTION_DAYS = int(os.environ.get("SHAMSHYRAQ_VIEW_ROLLUP_RETENTION_DAYS", "400"))
+VIEW_PRUNE_INTERVAL = float(os.environ.get("SHAMSHYRAQ_VIEW_PRUNE_INTERVAL", "3600"))
+VIEW_PRUNE_BATCH = 5000
+# После стольких неудачных сбросов подряд пачка просмотров выбрасывается, а не копится в памяти
+VIEW_FLUSH_MAX_FAILURES = int(os.environ.get("SHAMSHYRAQ_VIEW_FLUSH_MAX_FAILURES", "5"))
+POPULAR_DAYS = 7
+POPULAR_LIMIT = 5
+ACTIVITY_DAYS = 14
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50
+# Если совпадений больше, bm25 по всем обходится дорого - показываем новые сверху
+SEARCH_RANK_LIMIT = int(os.environ.get("SHAMSHYRAQ_SEARCH_RANK_LIMIT", "500"))
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """Настройки SQLite (PRAGMA) для соединений приложения"""
+    journal_mode: str = os.environ.get("SHAMSHYRAQ_JOURNAL_MODE", "wal")
+    synchronous: str = os.environ.get("SHAMSHYRAQ_SYNCHRONOUS", "NORMAL")
+    mmap_size: int = int(os.environ.get("SHAMSHYRAQ_MMAP_SIZE", str(64 * 1024 * 1024)))
+    cache_size: int = int(os.environ.get("SHAMSHYRAQ_CACHE_SIZE", "-16000"))  # отрицательное значение - в KiB
+    busy_timeout: int = int(os.environ.get("SHAMSHYRAQ_BUSY_TIMEOUT", "5000"))  # мс
+
+    def apply(self, conn: sqlite3.Connection, readonly: bool = False):
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if not readonly:
+            # journal_mode сохраняется в файле БД, synchronous действует на соединение
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+
+
+DEFAULT_PROFILE = StorageProfile()
+# Прежнее поведение: журнал отката и полный fsync (для сравнения в бенчмарках)
+LEGACY_PROFILE = StorageProfile(journal_mode="delete", synchronous="FULL", mmap_size=0, cache_size=-2000)
+
+
+def connect(db_name=DB_PATH, profile: Optional[StorageProfile] = None,
+            readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_name)}?mode=ro", uri=True, check_same_thread=False)
+    else:
         # Создаем папку data если она не существует
-        os.makedirs(os.path.dirname(db_name), exist_ok=True)
+        os.makedirs(os.path.dirname(db_name) or ".", exist_ok=True)
+        conn = sqlite3.connect(db_name, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    if profile is not None:
+        profile.apply(conn, readonly=readonly)
+    return conn
 
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cur = self.conn.cursor()
-        self.create_tables()
-        self.insert_initial_data()
 
-    def create_tables(self):
-        # Таблица пользователей
-        self.cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+# Наблюдатель SQL: fn(sql, seconds), задается metrics.install
+_sql_observer = None
 
-        # Таблица упражнений (exercise)
-        self.cur.execute("""
-            CREATE TABLE IF NOT EXISTS exercise (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT NOT NULL,
-                video_url TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
 
-        # Таблица советов (advice)
-        self.cur.execute("""
-            CREATE TABLE IF NOT EXISTS advice (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                content TEXT NOT NULL,
-                video_url TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+def set_sql_observer(fn):
+    global _sql_observer
+    _sql_observer = fn
 
-        # Таблица комментариев
-        self.cur.execute("""
-            CREATE TABLE IF NOT EXISTS comments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                comment TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
 
-        # Таблица истории просмотров
-        self.cur.execute("""
-            CREATE TABLE IF NOT EXISTS view_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                item_type TEXT NOT NULL, -- 'exercise' или 'advice'
-                item_id INTEGER NOT NULL,
-                item_name TEXT NOT NULL,
-                viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
+class TracingCursor:
+    """Курсор, сообщающий наблюдателю текст и длительность каждого запроса"""
 
-        self.conn.commit()
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            self._cur.execute(sql, parameters)
+        finally:
+            _sql_observer(sql, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            self._cur.executemany(sql, seq_of_parameters)
+        finally:
+            _sql_observer(sql, time.perf_counter() - started)
+        return self
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def cursor(conn: sqlite3.Connection):
+    """Курсор соединения; при включенных замерах - TracingCursor"""
+    cur = conn.cursor()
+    return TracingCursor(cur) if _sql_observer is not None else cur
+
+
+class Writer:
+    """Единственное пишущее соединение: все записи выполняются по очереди"""
+
+    def __init__(self, db_name=DB_PATH, profile: StorageProfile = DEFAULT_PROFILE):
+        self.conn = connect(db_name, profile)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            cur = cursor(self.conn)
+            try:
+                yield cur
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений, создается один раз при старте приложения"""
+
+    def __init__(self, db_name=DB_PATH, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 profile: Optional[StorageProfile] = None, readonly: bool = False):
+        self.db_name = db_name
+        self.profile = profile
+        self.readonly = readonly
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+        # Метрики ожидания выдачи соединения
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+
+        try:
+            conn = self._idle.get_nowait()
+            waited = 0.0
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = connect(self.db_name, self.profile, readonly=self.readonly)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                waited = 0.0
+            else:
+                # Все соединения заняты - ждем освобождения
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No free database connection after {self.timeout}s")
+                waited = time.perf_counter() - started
+
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        # Не возвращаем в пул незавершенную транзакцию
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_total_seconds": self.wait_total,
+                "wait_max_seconds": self.wait_max,
+                "wait_avg_seconds": self.wait_total / self.waits if self.waits else 0.0,
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Одна запись на (user_id, item_type, item_id): вставка или обновление времени просмотра
+VIEW_HISTORY_UPSERT = """
+    INSERT INTO view_history (user_id, item_type, item_id, item_name, viewed_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, item_type, item_id)
+    DO UPDATE SET item_name = excluded.item_name, viewed_at = excluded.viewed_at
+"""
+# Каждый просмотр - отдельное событие; сводки по дням обновляет триггер trg_view_events_rollup
+VIEW_EVENT_INSERT = """
+    INSERT INTO view_events (user_id, item_type, item_id, viewed_at) VALUES (?, ?, ?, ?)
+"""
+
+
+def prune_view_events(cur, now: Optional[datetime] = None, batch: int = VIEW_PRUNE_BATCH) -> int:
+    """Удалить события старше VIEW_EVENTS_RETENTION_DAYS (не больше batch за вызов)
+    и дневные сводки старше VIEW_ROLLUP_RETENTION_DAYS; сводки от удаления событий не меняются"""
+    now = now or datetime.now(timezone.utc)
+    events_before = (now - timedelta(days=VIEW_EVENTS_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    rollups_before = (now - timedelta(days=VIEW_ROLLUP_RETENTION_DAYS)).strftime("%Y-%m-%d")
+    cur.execute(
+        "DELETE FROM view_events WHERE id IN (SELECT id FROM view_events WHERE viewed_at < ? LIMIT ?)",
+        (events_before, batch)
+    )
+    removed = cur.rowcount
+    cur.execute("DELETE FROM view_item_daily WHERE day < ?", (rollups_before,))
+    cur.execute("DELETE FROM view_user_daily WHERE day < ?", (rollups_before,))
+    return removed
+
+
+def encode_comment_cursor(created_at: str, comment_id: int) -> str:
+    raw = f"{created_at}|{comment_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_comment_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    """Позиция (created_at, id) из курсора или None, если курсор испорчен"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, comment_id = raw.rsplit("|", 1)
+        return created_at, int(comment_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def sqlite_now() -> str:
+    """Текущее время UTC в формате CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+SEARCH_KINDS = tuple(SEARCH_INDEXES)
+_FOLD_TABLE = str.maketrans(KAZAKH_FOLD)
+_WORD = re.compile(r"\w+")
+_SNIPPET_OPEN, _SNIPPET_CLOSE = "\x02", "\x03"
+
+
+def fold_kazakh(text: str) -> str:
+    return text.translate(_FOLD_TABLE)
+
+
+def build_search_query(text: str) -> Optional[str]:
+    """Запрос пользователя -> выражение FTS5: все слова, каждое как префикс"""
+    words = _WORD.findall(fold_kazakh(text or ""))[:8]
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' if len(word) > 1 else f'"{word}"' for word in words)
+
+
+def snippet_html(snippet: str) -> str:
+    """Фрагмент из snippet() -> HTML с <mark> (сам текст экранируется)"""
+    return (html.escape(snippet or "")
+            .replace(_SNIPPET_OPEN, "<mark>")
+            .replace(_SNIPPET_CLOSE, "</mark>"))
+
+
+class ViewHistoryBuffer:
+    """Отложенная запись истории просмотров.
+
+    Для view_history события склеиваются по (user_id, item_type, item_id),
+    в журнал view_events идет каждое; и то и другое сбрасывается одной
+    транзакцией по размеру буфера или по таймеру в фоновом потоке. Тот же
+    поток раз в prune_interval удаляет устаревшие события. Если запись не
+    удается max_failures раз подряд (диск только для чтения, сломанная
+    схема), пачка выбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, writer: Writer, batch_size: int = VIEW_BATCH_SIZE,
+                 flush_interval: float = VIEW_FLUSH_INTERVAL, prune_interval: float = VIEW_PRUNE_INTERVAL,
+                 max_failures: int = VIEW_FLUSH_MAX_FAILURES):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self.max_failures = max_failures
+        self._failures = 0
+        self._pending: Dict[tuple, Dict] = {}
+        self._flushing: Dict[tuple, Dict] = {}
+        self._events: List[tuple] = []
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.events = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.events_pruned = 0
+        self.flush_errors = 0
+        self.dropped = 0
+
+    def add(self, user_id: int, item_type: str, item_id: int, item_name: str):
+        key = (user_id, item_type, item_id)
+        viewed_at = sqlite_now()
+        with self._lock:
+            self._pending[key] = {
+                "id": None,
+                "user_id": user_id,
+                "item_type": item_type,
+                "item_id": item_id,
+                "item_name": item_name,
+                "viewed_at": viewed_at,
+            }
+            self._events.append((user_id, item_type, item_id, viewed_at))
+            self.events += 1
+            full = len(self._events) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def pending_for(self, user_id: int) -> List[Dict]:
+        """Еще не записанные события пользователя (для чтения своих записей)"""
+        with self._lock:
+            merged = {k: v for k, v in self._flushing.items() if k[0] == user_id}
+            merged.update((k, v) for k, v in self._pending.items() if k[0] == user_id)
+        return [dict(v) for v in merged.values()]
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                events, self._events = self._events, []
+                batch = list(self._flushing.values())
+
+            try:
+                with self.writer.transaction() as cur:
+                    cur.executemany(VIEW_HISTORY_UPSERT, [
+                        (e["user_id"], e["item_type"], e["item_id"], e["item_name"], e["viewed_at"])
+                        for e in batch
+                    ])
+                    cur.executemany(VIEW_EVENT_INSERT, events)
+            except sqlite3.Error as e:
+                print(f"Error flushing view history: {e}")
+                self._failures += 1
+                self.flush_errors += 1
+                with self._lock:
+                    if self._failures >= self.max_failures:
+                        # Ошибка не проходит - не копим просмотры в памяти без предела
+                        self._flushing = {}
+                        self.dropped += len(events)
+                        print(f"Error flushing view history: dropped {len(batch)} views and {len(events)} events "
+                              f"after {self._failures} failed attempts")
+                        self._failures = 0
+                        return 0
+                    # Возвращаем события в буфер, не затирая более свежие
+                    self._flushing.update(self._pending)
+                    self._pending, self._flushing = self._flushing, {}
+                    self._events[:0] = events
+                return 0
+
+            self._failures = 0
+            with self._lock:
+                self._flushing = {}
+                self.flushes += 1
+                self.rows_flushed += len(batch)
+            return len(batch)
+
+    def prune(self) -> int:
+        """Удалить устаревшие события пачками, каждая - короткая транзакция"""
+        removed = 0
+        try:
+            while not self._stopped.is_set():
+                with self.writer.transaction() as cur:
+                    batch = prune_view_events(cur)
+                removed += batch
+                if batch < VIEW_PRUNE_BATCH:
+                    break
+        except sqlite3.Error as e:
+            print(f"Error pruning view events: {e}")
+        self.events_pruned += removed
+        return removed
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() - self._pruned_at >= self.prune_interval:
+                self._pruned_at = time.monotonic()
+                self.prune()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="view-history-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Финальный сброс при остановке
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "events": self.events,
+                "flushes": self.flushes,
+                "rows_flushed": self.rows_flushed,
+                "events_pruned": self.events_pruned,
+                "flush_errors": self.flush_errors,
+                "dropped": self.dropped,
+            }
+
+
+class CatalogCache:
+    """Кэш упражнений и советов в памяти процесса.
+
+    Сбрасывается методами add_exercise/add_advice, а изменения из других
+    процессов замечает по счетчику в table_versions (триггеры на таблицах),
+    который проверяется не чаще раза в check_interval секунд.
+    Возвращаемые словари общие для всех запросов - их нельзя изменять.
+    """
+
+    TABLES = ("exercise", "advice")
+
+    def __init__(self, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot: Optional[Dict] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def get(self, db: "Database") -> Dict:
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            self.hits += 1
+            return snapshot
+
+        with db.read_snapshot():
+            version = db.get_table_version(*self.TABLES)
+            if snapshot is not None and snapshot["version"] == version:
+                self._checked_at = now
+                self.hits += 1
+                return snapshot
+            snapshot = db.load_catalog(version)
+        with self._lock:
+            self._snapshot = snapshot
+            self._checked_at = now
+            self.misses += 1
+        return snapshot
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": snapshot["version"] if snapshot else None,
+        }
+
+
+class Database:
+    def __init__(self, db_name=DB_PATH, pool: Optional[ConnectionPool] = None,
+                 writer: Optional[Writer] = None, profile: Optional[StorageProfile] = None,
+                 view_buffer: Optional[ViewHistoryBuffer] = None,
+                 catalog: Optional[CatalogCache] = None):
+        self.pool = pool
+        self.writer = writer
+        self.view_buffer = view_buffer
+        self.catalog = catalog
+        if pool is not None:
+            # Схема и начальные данные уже созданы при старте приложения
+            self.conn = pool.acquire()
+            self.cur = cursor(self.conn)
+        else:
+            self.conn = connect(db_name, profile)
+            self.cur = cursor(self.conn)
+            # Если схема актуальна, это один PRAGMA user_version без DDL
+            migrate(self.conn)
+            self.insert_initial_data()
+
+    @contextmanager
+    def read_snapshot(self):
+        """Несколько чтений в одной транзакции: все видят одно состояние БД"""
+        if self.conn.in_transaction:
+            yield
+            return
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self.conn.commit()
+
+    @contextmanager
+    def _write(self):
+        """Курсор для записи: через общий Writer, если он есть, иначе через свое соединение"""
+        if self.writer is not None:
+            with self.writer.transaction() as cur:
+                yield cur
+            return
+        try:
+            yield self.cur
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def index_search_rows(self, table: str, after_id: int = 0) -> int:
+        """Добавить в поисковый индекс строки table с id > after_id, которых там еще нет
+        (после массовой загрузки с отключенными триггерами)"""
+        if table not in SEARCH_INDEXES:
+            return 0
+        fts, columns, _ = SEARCH_INDEXES[table]
+        with self._write() as cur:
+            cur.execute(f"""
+                INSERT INTO {fts} (rowid, {", ".join(columns)})
+                SELECT id, {", ".join(fold_sql(c) for c in columns)} FROM {table}
+                WHERE id > ? AND id NOT IN (SELECT id FROM {fts}_docsize)
+            """, (after_id,))
+            return cur.rowcount
+
+    def bump_table_version(self, table: str):
+        with self._write() as cur:
+            cur.execute("UPDATE table_versions SET version = version + 1 WHERE name = ?", (table,))
+
+    def get_table_version(self, *tables: str) -> int:
+        placeholders = ", ".join("?" for _ in tables)
+        self.cur.execute(
+            f"SELECT COALESCE(SUM(version), 0) AS version FROM table_versions WHERE name IN ({placeholders})",
+            tables
+        )
+        return self.cur.fetchone()["version"]
+
+    def get_view_history_version(self, user_id: int) -> Tuple[str, List[Dict]]:
+        """Версия истории пользователя и его еще не сброшенные просмотры (для get_view_history).
+
+        Версия - число записанных просмотров пользователя (view_user_stats, общее для
+        всех воркеров) и отпечаток несброшенных записей буфера этого процесса: чужие
+        просмотры ее не меняют, а без несброшенных записей она одна в любом воркере.
+        """
+        self.cur.execute("SELECT views FROM view_user_stats WHERE user_id = ?", (user_id,))
+        row = self.cur.fetchone()
+        version = str(row["views"] if row is not None else 0)
+        pending = self.view_buffer.pending_for(user_id) if self.view_buffer is not None else []
+        if pending:
+            marks = sorted((p["item_type"], p["item_id"], p["item_name"], p["viewed_at"]) for p in pending)
+            version += "." + hashlib.sha1(repr(marks).encode("utf-8")).hexdigest()[:12]
+        return version, pending
 
     def insert_initial_data(self):
         """Вставляем начальные данные если таблицы пустые"""
@@ -116,125 +647,377 @@ class Database:
 
         self.conn.commit()
 
+    def get_catalog(self) -> Dict:
+        """Снимок каталога: версия и данные из одного чтения (общий из CatalogCache, если он есть)"""
+        if self.catalog is not None:
+            return self.catalog.get(self)
+        return self.load_catalog()
+
+    def load_catalog(self, version: Optional[int] = None) -> Dict:
+        """version - уже прочитанная в текущей транзакции версия каталога"""
+        with self.read_snapshot():
+            if version is None:
+                version = self.get_table_version(*CatalogCache.TABLES)
+            exercises = self.load_exercises()
+            advice = self.load_advice()
+        return {
+            "version": version,
+            "exercises": exercises,
+            "advice": advice,
+            "exercise_by_id": {e["id"]: e for e in exercises},
+            "advice_by_id": {a["id"]: a for a in advice},
+        }
+
     # Методы для работы с упражнениями
     def get_all_exercises(self) -> List[Dict]:
+        if self.catalog is not None:
+            return list(self.catalog.get(self)["exercises"])
+        return self.load_exercises()
+
+    def load_exercises(self) -> List[Dict]:
         self.cur.execute("SELECT * FROM exercise ORDER BY id")
         rows = self.cur.fetchall()
         return [dict(row) for row in rows]
 
     def get_exercise_by_id(self, exercise_id: int) -> Optional[Dict]:
+        if self.catalog is not None:
+            return self.catalog.get(self)["exercise_by_id"].get(exercise_id)
         self.cur.execute("SELECT * FROM exercise WHERE id = ?", (exercise_id,))
         row = self.cur.fetchone()
         return dict(row) if row else None
 
     def add_exercise(self, name: str, description: str, video_url: str) -> bool:
         try:
-            self.cur.execute(
-                "INSERT INTO exercise (name, description, video_url) VALUES (?, ?, ?)",
-                (name, description, video_url)
-            )
-            self.conn.commit()
+            with self._write() as cur:
+                cur.execute(
+                    "INSERT INTO exercise (name, description, video_url) VALUES (?, ?, ?)",
+                    (name, description, video_url)
+                )
+            if self.catalog is not None:
+                self.catalog.invalidate()
             return True
         except sqlite3.Error:
             return False
 
     # Методы для работы с советами
     def get_all_advice(self) -> List[Dict]:
+        if self.catalog is not None:
+            return list(self.catalog.get(self)["advice"])
+        return self.load_advice()
+
+    def load_advice(self) -> List[Dict]:
         self.cur.execute("SELECT * FROM advice ORDER BY id")
         rows = self.cur.fetchall()
         return [dict(row) for row in rows]
 
     def get_advice_by_id(self, advice_id: int) -> Optional[Dict]:
+        if self.catalog is not None:
+            return self.catalog.get(self)["advice_by_id"].get(advice_id)
         self.cur.execute("SELECT * FROM advice WHERE id = ?", (advice_id,))
         row = self.cur.fetchone()
         return dict(row) if row else None
 
     def add_advice(self, name: str, content: str, video_url: str) -> bool:
         try:
-            self.cur.execute(
-                "INSERT INTO advice (name, content, video_url) VALUES (?, ?, ?)",
-                (name, content, video_url)
-            )
-            self.conn.commit()
+            with self._write() as cur:
+                cur.execute(
+                    "INSERT INTO advice (name, content, video_url) VALUES (?, ?, ?)",
+                    (name, content, video_url)
+                )
+            if self.catalog is not None:
+                self.catalog.invalidate()
             return True
         except sqlite3.Error:
             return False
 
     # Методы для комментариев
     def add_comment(self, user_id: int, first_name: str, last_name: str, comment: str) -> bool:
+        return self.create_comment(user_id, first_name, last_name, comment) is not None
+
+    def create_comment(self, user_id: int, first_name: str, last_name: str, comment: str) -> Optional[Dict]:
+        """Как add_comment, но возвращает сохраненную строку (id, created_at) или None"""
         try:
-            self.cur.execute(
-                "INSERT INTO comments (user_id, first_name, last_name, comment) VALUES (?, ?, ?, ?)",
-                (user_id, first_name, last_name, comment)
-            )
-            self.conn.commit()
-            return True
+            with self._write() as cur:
+                cur.execute(
+                    "INSERT INTO comments (user_id, first_name, last_name, comment) VALUES (?, ?, ?, ?) "
+                    "RETURNING *",
+                    (user_id, first_name, last_name, comment)
+                )
+                row = dict(cur.fetchone())
+            return row
         except sqlite3.Error as e:
             print(f"Error adding comment: {e}")
-            return False
+            return None
 
     def get_all_comments(self) -> List[Dict]:
         self.cur.execute("""
             SELECT c.*, u.name as user_name 
             FROM comments c 
             LEFT JOIN users u ON c.user_id = u.id 
-            ORDER BY c.created_at DESC
+            ORDER BY c.created_at DESC, c.id DESC
         """)
         rows = self.cur.fetchall()
         return [dict(row) for row in rows]
 
+    def get_comments_page(self, cursor: Optional[str] = None,
+                          limit: int = COMMENTS_PAGE_SIZE) -> Tuple[List[Dict], Optional[str]]:
+        """Страница комментариев (новые сверху) и курсор следующей страницы"""
+        limit = max(1, min(limit, COMMENTS_MAX_PAGE_SIZE))
+        position = decode_comment_cursor(cursor) if cursor else None
+
+        if position is None:
+            self.cur.execute("""
+                SELECT c.*, u.name as user_name
+                FROM comments c
+                LEFT JOIN users u ON c.user_id = u.id
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT ?
+            """, (limit + 1,))
+        else:
+            self.cur.execute("""
+                SELECT c.*, u.name as user_name
+                FROM comments c
+                LEFT JOIN users u ON c.user_id = u.id
+                WHERE (c.created_at, c.id) < (?, ?)
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT ?
+            """, (position[0], position[1], limit + 1))
+
+        rows = [dict(row) for row in self.cur.fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_comment_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        return rows, next_cursor
+
+    def get_comments_after(self, last_id: int, limit: int = COMMENTS_MAX_PAGE_SIZE) -> List[Dict]:
+        """Комментарии с id больше last_id в порядке добавления (для ленты)"""
+        self.cur.execute("""
+            SELECT c.*, u.name as user_name
+            FROM comments c
+            LEFT JOIN users u ON c.user_id = u.id
+            WHERE c.id > ?
+            ORDER BY c.id
+            LIMIT ?
+        """, (last_id, limit))
+        return [dict(row) for row in self.cur.fetchall()]
+
+    def get_last_comment_id(self) -> int:
+        self.cur.execute("SELECT COALESCE(MAX(id), 0) AS id FROM comments")
+        return self.cur.fetchone()["id"]
+
     def get_user_comments(self, user_id: int) -> List[Dict]:
         self.cur.execute("SELECT * FROM comments WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
         rows = self.cur.fetchall()
         return [dict(row) for row in rows]
 
+    # Поиск
+    def _search_kind(self, kind: str, match: str, limit: int, offset: int = 0) -> List[Dict]:
+        fts = SEARCH_INDEXES[kind][0]
+        if kind == "comments":
+            title = "t.first_name || ' ' || t.last_name"
+            extra = "t.created_at"
+        else:
+            title = "t.name"
+            extra = "NULL"
+
+        # Проверка без ранжирования: есть ли больше SEARCH_RANK_LIMIT совпадений
+        self.cur.execute(
+            f"SELECT 1 FROM {fts} WHERE {fts} MATCH ? LIMIT 1 OFFSET ?", (match, SEARCH_RANK_LIMIT)
+        )
+        order = "rowid DESC" if self.cur.fetchone() is not None else "rank"
+
+        # ORDER BY rank с LIMIT FTS5 выполняет сам, snippet() считается только для отобранных строк
+        self.cur.execute(f"""
+            SELECT m.id, m.rank, m.snippet, {title} AS title, {extra} AS created_at
+            FROM (
+                SELECT rowid AS id, rank, snippet({fts}, -1, ?, ?, '…', 16) AS snippet
+                FROM {fts}
+                WHERE {fts} MATCH ?
+                ORDER BY {order}
+                LIMIT ? OFFSET ?
+            ) m
+            JOIN {kind} t ON t.id = m.id
+        """, (_SNIPPET_OPEN, _SNIPPET_CLOSE, match, limit, offset))
+        results = []
+        for row in self.cur.fetchall():
+            item = dict(row)
+            item["kind"] = kind
+            item["snippet"] = snippet_html(item["snippet"])
+            item["url"] = "/voices" if kind == "comments" else f"/{kind}/{item['id']}"
+            results.append(item)
+        if order == "rank":
+            results.sort(key=lambda r: r["rank"])
+        return results
+
+    def search(self, query: str, kind: Optional[str] = None, page: int = 1,
+               page_size: int = SEARCH_PAGE_SIZE) -> Tuple[List[Dict], bool]:
+        """Результаты поиска по bm25 (лучшие сверху) и есть ли следующая страница.
+
+        kind - одна из SEARCH_KINDS или None (везде). Оценки bm25 разных таблиц
+        сравниваются напрямую - для общего списка этого достаточно. Если в таблице
+        совпадений больше SEARCH_RANK_LIMIT (частое слово), ее строки идут от новых к старым.
+        """
+        match = build_search_query(query)
+        if match is None:
+            return [], False
+        page = max(1, min(page, SEARCH_MAX_PAGE))
+        page_size = max(1, min(page_size, COMMENTS_MAX_PAGE_SIZE))
+        offset = (page - 1) * page_size
+
+        try:
+            if kind in SEARCH_INDEXES:
+                # На одну строку больше - чтобы узнать, есть ли следующая страница
+                results = self._search_kind(kind, match, page_size + 1, offset)
+                return results[:page_size], len(results) > page_size
+            # Общий список: из каждой таблицы лучшие offset + page_size + 1 строк, затем слияние
+            results = []
+            for k in SEARCH_KINDS:
+                results.extend(self._search_kind(k, match, offset + page_size + 1))
+        except sqlite3.OperationalError as e:
+            print(f"Error searching: {e}")
+            return [], False
+        results.sort(key=lambda r: r["rank"])
+        return results[offset:offset + page_size], len(results) > offset + page_size
+
     # Методы для истории просмотров
     def add_view_history(self, user_id: int, item_type: str, item_id: int, item_name: str) -> bool:
+        if self.view_buffer is not None:
+            # Запись уйдет в БД пачкой из фонового потока
+            self.view_buffer.add(user_id, item_type, item_id, item_name)
+            return True
+        viewed_at = sqlite_now()
         try:
-            # Проверяем, есть ли уже такая запись в истории
-            self.cur.execute(
-                "SELECT * FROM view_history WHERE user_id = ? AND item_type = ? AND item_id = ?",
-                (user_id, item_type, item_id)
-            )
-            existing = self.cur.fetchone()
-
-            if not existing:
-                # Добавляем новую запись
-                self.cur.execute(
-                    "INSERT INTO view_history (user_id, item_type, item_id, item_name) VALUES (?, ?, ?, ?)",
-                    (user_id, item_type, item_id, item_name)
-                )
-            else:
-                # Обновляем время просмотра
-                self.cur.execute(
-                    "UPDATE view_history SET viewed_at = CURRENT_TIMESTAMP WHERE id = ?",
-                    (existing['id'],)
-                )
-
-            self.conn.commit()
+            with self._write() as cur:
+                cur.execute(VIEW_HISTORY_UPSERT, (user_id, item_type, item_id, item_name, viewed_at))
+                cur.execute(VIEW_EVENT_INSERT, (user_id, item_type, item_id, viewed_at))
             return True
         except sqlite3.Error as e:
             print(f"Error adding view history: {e}")
             return False
 
-    def get_view_history(self, user_id: int) -> List[Dict]:
+    def get_view_history(self, user_id: int, pending: Optional[List[Dict]] = None) -> List[Dict]:
+        """Последние 20 просмотров; pending - уже прочитанные несброшенные записи буфера"""
         self.cur.execute(
             "SELECT * FROM view_history WHERE user_id = ? ORDER BY viewed_at DESC LIMIT 20",
             (user_id,)
         )
-        rows = self.cur.fetchall()
-        return [dict(row) for row in rows]
+        rows = [dict(row) for row in self.cur.fetchall()]
+        if self.view_buffer is None:
+            return rows
+
+        # Подмешиваем еще не сброшенные просмотры
+        if pending is None:
+            pending = self.view_buffer.pending_for(user_id)
+        if not pending:
+            return rows
+        keys = {(p["item_type"], p["item_id"]) for p in pending}
+        rows = [r for r in rows if (r["item_type"], r["item_id"]) not in keys] + pending
+        rows.sort(key=lambda r: str(r["viewed_at"]), reverse=True)
+        return rows[:20]
+
+    def get_popular_items(self, days: int = POPULAR_DAYS, limit: int = POPULAR_LIMIT) -> Dict[str, List[Dict]]:
+        """Самые просматриваемые упражнения и советы за последние days дней (по дневным сводкам:
+        читается не больше days строк на материал, сколько бы ни было просмотров)"""
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        popular = {}
+        for item_type in CatalogCache.TABLES:
+            self.cur.execute(f"""
+                SELECT d.item_id AS id, i.name, SUM(d.views) AS views
+                FROM view_item_daily d JOIN {item_type} i ON i.id = d.item_id
+                WHERE d.item_type = ? AND d.day >= ?
+                GROUP BY d.item_id
+                ORDER BY views DESC, d.item_id
+                LIMIT ?
+            """, (item_type, since, limit))
+            popular[item_type] = [dict(row) for row in self.cur.fetchall()]
+        return popular
+
+    def get_user_activity(self, user_id: int, days: int = ACTIVITY_DAYS) -> Dict:
+        """Итоги пользователя и число просмотров по дням за последние days дней"""
+        today = datetime.now(timezone.utc).date()
+        since = today - timedelta(days=days - 1)
+        self.cur.execute("SELECT * FROM view_user_stats WHERE user_id = ?", (user_id,))
+        row = self.cur.fetchone()
+        activity = {"views": 0, "active_days": 0, "current_streak": 0, "longest_streak": 0, "last_day": None}
+        if row is not None:
+            activity.update(dict(row))
+            del activity["user_id"]
+            # Серия прерывается, если вчера и сегодня просмотров не было
+            if activity["last_day"] < (today - timedelta(days=1)).isoformat():
+                activity["current_streak"] = 0
+
+        self.cur.execute(
+            "SELECT day, views FROM view_user_daily WHERE user_id = ? AND day >= ?", (user_id, since.isoformat())
+        )
+        counts = {r["day"]: r["views"] for r in self.cur.fetchall()}
+        activity["days"] = []
+        for n in range(days):
+            day = (since + timedelta(days=n)).isoformat()
+            activity["days"].append({"day": day, "views": counts.get(day, 0)})
+        activity["max_day_views"] = max(d["views"] for d in activity["days"])
+        return activity
+
+    # Рекомендации (recommendations.py)
+    def iter_view_pairs(self, batch: int = 10000) -> Iterator[int]:
+        """user_id, is_advice, item_id подряд - кто что открывал, по строке на пользователя и материал.
+        Строки читаются пачками по batch, а не списком всей таблицы"""
+        cur = cursor(self.conn)
+        cur.execute("SELECT user_id, item_type = 'advice' AS is_advice, item_id FROM view_history")
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            for row in rows:
+                yield from row
+
+    def get_item_neighbors_build(self) -> Optional[sqlite3.Row]:
+        self.cur.execute("SELECT * FROM item_neighbors_build WHERE id = 1")
+        return self.cur.fetchone()
+
+    def get_item_neighbors(self) -> List[sqlite3.Row]:
+        self.cur.execute("SELECT * FROM item_neighbors ORDER BY item_type, item_id, rank")
+        return self.cur.fetchall()
+
+    def save_item_neighbors(self, source_version: int, rows: List[Tuple], items: int, users: int,
+                            seconds: float) -> bool:
+        """Заменить всех соседей одной транзакцией (читатели видят либо старый, либо новый набор)"""
+        try:
+            with self._write() as cur:
+                cur.execute("DELETE FROM item_neighbors")
+                cur.executemany(
+                    "INSERT INTO item_neighbors (item_type, item_id, rank, neighbor_type, neighbor_id, score) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                cur.execute("""
+                    INSERT OR REPLACE INTO item_neighbors_build (id, source_version, built_at, items, users, seconds)
+                    VALUES (1, ?, ?, ?, ?, ?)
+                """, (source_version, time.time(), items, users, seconds))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving item neighbors: {e}")
+            return False
 
     # Методы для пользователей
-    def insert_user(self, name, email, password):
+    def insert_user(self, name, email, password_hash):
+        """password_hash - результат passwords.hash_password"""
         try:
-            self.cur.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                             (name, email, password))
-            self.conn.commit()
+            with self._write() as cur:
+                cur.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                            (name, email, password_hash))
             return True
         except sqlite3.IntegrityError:
             return False  # Email уже существует
 
+    def update_password(self, user_id: int, password_hash: str) -> bool:
+        try:
+            with self._write() as cur:
+                cur.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating password: {e}")
+            return False
+
     def get_user_by_email(self, email) -> Optional[sqlite3.Row]:
         self.cur.execute("SELECT * FROM users WHERE email = ?", (email,))
         return self.cur.fetchone()
@@ -245,7 +1028,7 @@ class Database:
 
     def verify_user(self, email, password) -> bool:
         user = self.get_user_by_email(email)
-        if user and user['password'] == password:
+        if user and verify_password(password, user['password'])[0]:
             return True
         return False
 
@@ -253,15 +1036,157 @@ class Database:
         self.cur.execute("SELECT * FROM users")
         return self.cur.fetchall()
 
+    # Методы для сессий
+    def save_session(self, session_id: str, user_id: int, data: str, expires_at: float) -> bool:
+        try:
+            with self._write() as cur:
+                cur.execute(
+                    "INSERT OR REPLACE INTO sessions (id, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+                    (session_id, user_id, data, expires_at)
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving session: {e}")
+            return False
+
+    def get_session(self, session_id: str, now: float) -> Optional[sqlite3.Row]:
+        self.cur.execute(
+            "SELECT * FROM sessions WHERE id = ? AND expires_at > ?", (session_id, now)
+        )
+        return self.cur.fetchone()
+
+    def touch_session(self, session_id: str, expires_at: float) -> bool:
+        try:
+            with self._write() as cur:
+                cur.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, session_id))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error touching session: {e}")
+            return False
+
+    def delete_session(self, session_id: str) -> bool:
+        try:
+            with self._write() as cur:
+                cur.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error deleting session: {e}")
+            return False
+
+    def delete_expired_sessions(self, now: float) -> int:
+        try:
+            with self._write() as cur:
+                cur.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                return cur.rowcount
+        except sqlite3.Error as e:
+            print(f"Error deleting expired sessions: {e}")
+            return 0
+
+    # Ограничение частоты запросов (общие ведра token bucket)
+    def take_rate_token(self, key: str, capacity: float, rate: float, now: float) -> float:
+        """Забрать жетон из ведра key; 0 - разрешено, иначе через сколько секунд появится жетон"""
+        try:
+            with self._write() as cur:
+                # Пополнение и списание одним запросом: ведро меняется, только если жетон есть
+                cur.execute("""
+                    INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ? - 1, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        tokens = min(excluded.tokens + 1, tokens + (excluded.updated_at - updated_at) * ?) - 1,
+                        updated_at = excluded.updated_at
+                    WHERE min(excluded.tokens + 1, tokens + (excluded.updated_at - updated_at) * ?) >= 1
+                    RETURNING tokens
+                """, (key, capacity, now, rate, rate))
+                if cur.fetchall():
+                    return 0.0
+                cur.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,))
+                row = cur.fetchone()
+        except sqlite3.Error as e:
+            # Хранилище недоступно - не блокируем пользователей
+            print(f"Error taking rate token: {e}")
+            return 0.0
+        available = min(capacity, row["tokens"] + (now - row["updated_at"]) * rate)
+        return max((1 - available) / rate, 0.0)
+
+    def delete_idle_rate_buckets(self, before: float) -> int:
+        """Удалить ведра, не тронутые с before (к этому времени они снова полные)"""
+        try:
+            with self._write() as cur:
+                cur.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (before,))
+                return cur.rowcount
+        except sqlite3.Error as e:
+            print(f"Error deleting idle rate buckets: {e}")
+            return 0
+
     def close(self):
         self.cur.close()
-        self.conn.close()
+        if self.pool is not None:
+            self.pool.release(self.conn)
+        else:
+            self.conn.close()
 
 
-# Функция для dependency injection
-def get_db():
-    db = Database()
+# Общий пул читающих соединений, единственный писатель, буфер истории и кэш каталога процесса
+_pool: Optional[ConnectionPool] = None
+_writer: Optional[Writer] = None
+_view_buffer: Optional[ViewHistoryBuffer] = None
+_catalog = CatalogCache()
+
+
+def init_db(db_name=DB_PATH, pool_size: int = POOL_SIZE,
+            profile: StorageProfile = DEFAULT_PROFILE) -> ConnectionPool:
+    """Создаем схему, начальные данные, писателя и пул соединений (один раз при старте)"""
+    global _pool, _writer, _view_buffer
+    Database(db_name, profile=profile).close()
+    _writer = Writer(db_name, profile)
+    _pool = ConnectionPool(db_name, size=pool_size, profile=profile, readonly=True)
+    _view_buffer = ViewHistoryBuffer(_writer)
+    _view_buffer.start()
+    _catalog.invalidate()
+    return _pool
+
+
+def close_db():
+    global _pool, _writer, _view_buffer
+    if _view_buffer is not None:
+        _view_buffer.stop()
+        _view_buffer = None
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def get_pool() -> Optional[ConnectionPool]:
+    return _pool
+
+
+def db_stats() -> Dict:
+    """Показатели пула, буфера истории и кэша каталога одним словарем"""
+    result = {}
+    for prefix, source in (("pool", _pool), ("view_buffer", _view_buffer), ("catalog", _catalog)):
+        if source is not None:
+            for key, value in source.stats().items():
+                result[f"{prefix}_{key}"] = value
+    return result
+
+
+@contextmanager
+def open_db():
+    """Database на соединении из общего пула (или отдельное соединение, если пула нет)"""
+    if _pool is not None:
+        db = Database(pool=_pool, writer=_writer, view_buffer=_view_buffer, catalog=_catalog)
+    else:
+        db = Database()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Функция для dependency injection
+def get_db():
+    with open_db() as db:
+        yield db
+
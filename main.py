@@ -1,26 +1,127 @@
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+import os
 import secrets
-from datebase import Database, get_db
+import assets
+import compression
+import metrics
+import template_cache
+import video
+from backup import BackupScheduler, list_backups
+from api_cache import ApiCache, FIELDS, json_response, parse_fields, project
+from comment_feed import CommentFeed
+from async_db import AsyncDatabase, DBQueueFull, get_async_db, get_executor, init_executor, close_executor
+from datebase import init_db, close_db, db_stats, open_db, COMMENTS_PAGE_SIZE, SEARCH_KINDS
+from page_cache import PageCache
+from passwords import DUMMY_HASH, init_hasher, close_hasher, hash_password_async, verify_password_async
+from rate_limit import ConcurrencyLimiter, Overloaded, RateLimited, RateLimiter, client_ip, retry_after_header
+from recommendations import Recommender
+from session_store import SessionStore
 from typing import Optional
 
-app = FastAPI()
+# Для сессий (общее хранилище в БД + кэш процесса)
+sessions = SessionStore()
+# Новые комментарии для /voices/stream
+comment_feed = CommentFeed()
+# Частота запросов по клиенту и одновременность по классу маршрутов
+rate_limiter = RateLimiter()
+concurrency = ConcurrencyLimiter()
+# Снимки БД по расписанию и по запросу /admin/backup
+backups = BackupScheduler()
+# "Что открыть дальше": соседи материалов и кандидаты пользователей, считаются в фоне
+recommender = Recommender()
+# Токен для /admin/*; пустой - маршруты администрирования выключены
+ADMIN_TOKEN = os.environ.get("SHAMSHYRAQ_ADMIN_TOKEN", "")
+# Токен для /metrics (тексты SQL, состояние пулов и очередей); пустой - только запросы с этой машины
+METRICS_TOKEN = os.environ.get("SHAMSHYRAQ_METRICS_TOKEN", "")
+LOCAL_HOSTS = ("127.0.0.1", "::1")
+# Заголовки, которые ставит обратный прокси: такой запрос пришел не с этой машины
+PROXY_HEADERS = ("x-forwarded-for", "forwarded", "x-real-ip")
+
+
+async def load_comments_after(last_id: int):
+    return await get_async_db().get_comments_after(last_id)
+
+
+async def load_last_comment_id():
+    return await get_async_db().get_last_comment_id()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема, начальные данные и пул соединений создаются один раз
+    init_db()
+    # Сборка статики (инкрементальная, воркеры по очереди); SHAMSHYRAQ_BUILD_ASSETS=0 - только читать manifest
+    if os.environ.get("SHAMSHYRAQ_BUILD_ASSETS", "1") != "0":
+        assets.build_assets()
+    else:
+        assets.load_manifest()
+    # Шаблоны и каталог загружаются до первого запроса
+    if template_cache.TEMPLATE_WARMUP:
+        count, seconds = template_cache.warm_up(templates)
+        print(f"Warmed up {count} templates in {seconds * 1000:.0f} ms")
+    with open_db() as db:
+        db.get_all_exercises()
+    init_executor()
+    init_hasher()
+    sessions.start()
+    rate_limiter.start()
+    backups.start()
+    recommender.start()
+    comment_feed.start(load_comments_after, load_last_comment_id, await load_last_comment_id())
+    yield
+    await comment_feed.stop()
+    recommender.stop()
+    backups.stop()
+    rate_limiter.stop()
+    sessions.stop()
+    close_hasher()
+    close_executor()
+    video.close_video_io()
+    close_db()
+
+
+app = FastAPI(lifespan=lifespan)
+# gzip/brotli для HTML и JSON (статика уже сжата при сборке, SSE не трогаем)
+app.add_middleware(compression.CompressionMiddleware)
+# Server-Timing и гистограммы по маршрутам, SQL и шаблонам
+app.add_middleware(metrics.TimingMiddleware)
 
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = assets.asset_url
+# Байткод шаблонов на диске, без проверки файлов при каждом рендере
+template_cache.configure(templates)
+metrics.install(templates)
+# Кэш статичных страниц с ETag/304
+page_cache = PageCache(templates)
+# Готовые JSON-ответы /api/v1 по версии данных
+api_cache = ApiCache()
+# Фрагмент одного комментария рендерится один раз и уходит всем подписчикам ленты
+comment_feed.render = lambda comment: templates.get_template("_comment.html").render(comment=comment)
+metrics.register_gauges("db", db_stats)
+metrics.register_gauges("executor", lambda: get_executor().stats())
+metrics.register_gauges("page_cache", page_cache.stats)
+metrics.register_gauges("sessions", sessions.stats)
+metrics.register_gauges("comment_feed", comment_feed.stats)
+metrics.register_gauges("api_cache", api_cache.stats)
+metrics.register_gauges("compression", compression.stats)
+metrics.register_gauges("rate_limit", rate_limiter.stats)
+metrics.register_gauges("concurrency", concurrency.stats)
+metrics.register_gauges("backup", backups.stats)
+metrics.register_gauges("recommendations", recommender.stats)
+# Собранные файлы с хэшем в имени - раньше общего /static
+os.makedirs(os.path.join(assets.STATIC_DIR, assets.BUILD_DIR), exist_ok=True)
+app.mount(path="/static/build", app=assets.ImmutableStaticFiles(directory="static/build"), name="static_build")
 app.mount(path="/static", app=StaticFiles(directory="static"), name="static")
 
-# Для сессий
-sessions = {}
-
 
 def get_current_user(request: Request) -> Optional[dict]:
     """Получить текущего пользователя из сессии"""
     session_id = request.cookies.get("session_id")
-    if session_id and session_id in sessions:
-        return sessions[session_id]
-    return None
+    return sessions.get(session_id)
 
 
 def require_auth(request: Request):
@@ -31,6 +132,53 @@ def require_auth(request: Request):
     return user
 
 
+async def require_auth_async(request: Request):
+    """require_auth для async-маршрутов: поиск сессии в БД идет через пул БД"""
+    return await get_executor().run(require_auth, request)
+
+
+@app.exception_handler(DBQueueFull)
+def db_queue_full(request: Request, exc: DBQueueFull):
+    # Очередь к БД переполнена - просим повторить позже вместо бесконечного ожидания
+    return HTMLResponse("Сервер бос емес, кейінірек қайталаңыз", status_code=503, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(RateLimited)
+def rate_limited(request: Request, exc: RateLimited):
+    headers = {"Retry-After": retry_after_header(exc.retry_after)}
+    if wants_json(request):
+        return JSONResponse({"error": "too many requests"}, status_code=429, headers=headers)
+    return HTMLResponse("Сұраныстар тым көп, кейінірек қайталаңыз", status_code=429, headers=headers)
+
+
+@app.exception_handler(Overloaded)
+def overloaded(request: Request, exc: Overloaded):
+    headers = {"Retry-After": retry_after_header(exc.retry_after)}
+    if wants_json(request):
+        return JSONResponse({"error": "server busy"}, status_code=503, headers=headers)
+    return HTMLResponse("Сервер бос емес, кейінірек қайталаңыз", status_code=503, headers=headers)
+
+
+def limit(rule: str, route_class: str):
+    """Зависимость маршрута: сначала частота по клиенту (RateLimited -> 429),
+    затем место в классе маршрутов (Overloaded -> 503) на все время обработки"""
+    async def dependency(request: Request):
+        user = None
+        if request.cookies.get("session_id"):
+            user = await get_executor().run(get_current_user, request)
+        # Без действующей сессии ключ - IP: чужие или выдуманные session_id не дают новых ведер
+        client = f"user:{user['id']}" if user else f"ip:{client_ip(request)}"
+        if rate_limiter.enabled and rate_limiter.backend.blocking:
+            retry_after = await get_executor().run(rate_limiter.hit, rule, client)
+        else:
+            retry_after = rate_limiter.hit(rule, client)
+        if retry_after > 0:
+            raise RateLimited(rule, retry_after)
+        with concurrency.admit(route_class):
+            yield
+    return dependency
+
+
 # Главная страница (доступна без авторизации)
 @app.get("/", response_class=HTMLResponse)
 def read_index(request: Request):
@@ -45,32 +193,37 @@ def read_index(request: Request):
 
 # Страница hope.html с данными из БД (требует авторизации)
 @app.get("/hope", response_class=HTMLResponse)
-def read_hope(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_hope(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
     # Получаем упражнения и советы из базы данных
-    exercises = db.get_all_exercises()
-    advice_list = db.get_all_advice()
+    exercises = await db.get_all_exercises()
+    advice_list = await db.get_all_advice()
+    # Самые просматриваемые за неделю (из дневных сводок)
+    popular = await db.get_popular_items()
 
     return templates.TemplateResponse("hope.html", {
         "request": request,
         "title": "Үміт бағы",
         "user": user,
         "exercises": exercises,
-        "advice_list": advice_list
+        "advice_list": advice_list,
+        "popular": popular,
+        # Посчитаны заранее по истории просмотров - без запросов к БД
+        "recommended": recommender.for_user(user["id"])
     })
 
 
 # Страница упражнений (требует авторизации)
 @app.get("/exercise", response_class=HTMLResponse)
-def read_exercise(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_exercise(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    exercises = db.get_all_exercises()
+    exercises = await db.get_all_exercises()
 
     return templates.TemplateResponse("exercise.html", {
         "request": request,
@@ -82,12 +235,12 @@ def read_exercise(request: Request, db: Database = Depends(get_db)):
 
 # Страница конкретного упражнения (требует авторизации)
 @app.get("/exercise/{exercise_id}", response_class=HTMLResponse)
-def read_exercise_detail(request: Request, exercise_id: int, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_exercise_detail(request: Request, exercise_id: int, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    exercise = db.get_exercise_by_id(exercise_id)
+    exercise = await db.get_exercise_by_id(exercise_id)
     if not exercise:
         return templates.TemplateResponse("error.html", {
             "request": request,
@@ -98,24 +251,32 @@ def read_exercise_detail(request: Request, exercise_id: int, db: Database = Depe
 
     # Добавляем в историю просмотров
     if user:
-        db.add_view_history(user["id"], "exercise", exercise_id, exercise["name"])
+        await db.add_view_history(user["id"], "exercise", exercise_id, exercise["name"])
+        recommender.note_view(user["id"], "exercise", exercise_id)
 
     return templates.TemplateResponse("exercise_detail.html", {
         "request": request,
         "title": exercise["name"],
         "user": user,
-        "exercise": exercise
+        "exercise": exercise,
+        "similar": recommender.similar("exercise", exercise_id)
     })
 
 
+# Видео к упражнениям и советам: Range-запросы (206), ETag/Last-Modified
+@app.api_route("/video/{name}", methods=["GET", "HEAD"])
+async def read_video(name: str):
+    return await video.video_response(name)
+
+
 # Страница советов (требует авторизации)
 @app.get("/advice", response_class=HTMLResponse)
-def read_advice(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_advice(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    advice_list = db.get_all_advice()
+    advice_list = await db.get_all_advice()
 
     return templates.TemplateResponse("advice.html", {
         "request": request,
@@ -127,12 +288,12 @@ def read_advice(request: Request, db: Database = Depends(get_db)):
 
 # Страница конкретного совета (требует авторизации)
 @app.get("/advice/{advice_id}", response_class=HTMLResponse)
-def read_advice_detail(request: Request, advice_id: int, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_advice_detail(request: Request, advice_id: int, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    advice = db.get_advice_by_id(advice_id)
+    advice = await db.get_advice_by_id(advice_id)
     if not advice:
         return templates.TemplateResponse("error.html", {
             "request": request,
@@ -143,7 +304,8 @@ def read_advice_detail(request: Request, advice_id: int, db: Database = Depends(
 
     # Добавляем в историю просмотров
     if user:
-        db.add_view_history(user["id"], "advice", advice_id, advice["name"])
+        await db.add_view_history(user["id"], "advice", advice_id, advice["name"])
+        recommender.note_view(user["id"], "advice", advice_id)
 
     return templates.TemplateResponse("advice_detail.html", {
         "request": request,
@@ -155,91 +317,270 @@ def read_advice_detail(request: Request, advice_id: int, db: Database = Depends(
 
 # Страница voices.html с комментариями (требует авторизации)
 @app.get("/voices", response_class=HTMLResponse)
-def read_voices(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_voices(
+        request: Request,
+        cursor: Optional[str] = None,
+        page_size: int = COMMENTS_PAGE_SIZE,
+        db: AsyncDatabase = Depends(get_async_db)
+):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    # Получаем все комментарии
-    comments = db.get_all_comments()
+    # Получаем одну страницу комментариев
+    comments, next_cursor = await db.get_comments_page(cursor, page_size)
 
     return templates.TemplateResponse("voices.html", {
         "request": request,
         "title": "Дауыстар алаңы",
         "user": user,
-        "comments": comments
+        "comments": comments,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
+        "page_size": page_size
     })
 
 
+# Лента новых комментариев (Server-Sent Events)
+@app.get("/voices/stream")
+async def voices_stream(request: Request, last_event_id: Optional[int] = None):
+    user = await require_auth_async(request)
+    if isinstance(user, RedirectResponse):
+        return user
+
+    # При переподключении браузер сам присылает Last-Event-ID
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+
+    return StreamingResponse(
+        comment_feed.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def wants_json(request: Request) -> bool:
+    return "application/json" in request.headers.get("accept", "")
+
+
 # Добавление комментария
-@app.post("/add_comment", response_class=HTMLResponse)
-def add_comment(
+@app.post("/add_comment", response_class=HTMLResponse, dependencies=[Depends(limit("comment", "write"))])
+async def add_comment(
         request: Request,
         first_name: str = Form(...),
         last_name: str = Form(...),
         comment: str = Form(...),
-        db: Database = Depends(get_db)
+        db: AsyncDatabase = Depends(get_async_db)
 ):
-    user = require_auth(request)
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
+        if wants_json(request):
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
         return user
 
     # Валидация данных
     if not first_name or not last_name or not comment:
-        comments = db.get_all_comments()
+        if wants_json(request):
+            return JSONResponse({"error": "Барлық өрістерді толтырыңыз!"}, status_code=400)
+        comments, next_cursor = await db.get_comments_page()
         return templates.TemplateResponse("voices.html", {
             "request": request,
             "title": "Дауыстар алаңы",
             "user": user,
             "comments": comments,
+            "next_cursor": next_cursor,
             "error": "Барлық өрістерді толтырыңыз!"
         })
 
     # Сохраняем комментарий
-    success = db.add_comment(user["id"], first_name, last_name, comment)
+    created = await db.create_comment(user["id"], first_name, last_name, comment)
 
-    if not success:
-        comments = db.get_all_comments()
+    if created is None:
+        if wants_json(request):
+            return JSONResponse({"error": "Комментарий сақталмады. Өтінеміз, қайталаңыз."}, status_code=500)
+        comments, next_cursor = await db.get_comments_page()
         return templates.TemplateResponse("voices.html", {
             "request": request,
             "title": "Дауыстар алаңы",
             "user": user,
             "comments": comments,
+            "next_cursor": next_cursor,
             "error": "Комментарий сақталмады. Өтінеміз, қайталаңыз."
         })
 
+    # Рассылаем подписчикам ленты
+    created["user_name"] = user["name"]
+    comment_feed.publish(created)
+
+    # Скрипт страницы получает только новый комментарий, без перерисовки всей страницы
+    if wants_json(request):
+        return JSONResponse(comment_feed.public(created), status_code=201)
+
     # Возвращаемся на страницу с комментариями
     return RedirectResponse(url="/voices", status_code=302)
 
 
 # Страница истории просмотров
 @app.get("/history", response_class=HTMLResponse)
-def read_history(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_history(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
     # Получаем историю просмотров пользователя
-    view_history = db.get_view_history(user["id"])
+    view_history = await db.get_view_history(user["id"])
+    activity = await db.get_user_activity(user["id"])
 
     return templates.TemplateResponse("history.html", {
         "request": request,
         "title": "Менің тарихым",
         "user": user,
-        "view_history": view_history
+        "view_history": view_history,
+        "activity": activity
+    })
+
+
+# Поиск по упражнениям, советам и комментариям
+@app.get("/search", response_class=HTMLResponse)
+async def read_search(
+        request: Request,
+        q: str = "",
+        kind: Optional[str] = None,
+        page: int = 1,
+        db: AsyncDatabase = Depends(get_async_db)
+):
+    user = await require_auth_async(request)
+    if isinstance(user, RedirectResponse):
+        return user
+
+    if kind not in SEARCH_KINDS:
+        kind = None
+    results, has_more = await db.search(q, kind, page) if q.strip() else ([], False)
+
+    return templates.TemplateResponse("search.html", {
+        "request": request,
+        "title": "Іздеу",
+        "user": user,
+        "q": q,
+        "kind": kind,
+        "page": page,
+        "results": results,
+        "has_more": has_more
     })
 
 
+# JSON API (версия 1)
+def catalog_source(d, user):
+    """Версия каталога и снимок CatalogCache, из которого строится ответ"""
+    catalog = d.get_catalog()
+    return catalog["version"], catalog
+
+
+def table_source(*tables: str):
+    def source(d, user):
+        return d.get_table_version(*tables), None
+    return source
+
+
+async def api_response(request: Request, db: AsyncDatabase, resource: str, key: tuple,
+                       fields: Optional[str], source, load, per_user: bool = False):
+    """Ответ из api_cache: source(db, user) - (версия, снимок), load(db, user, снимок) - сами данные"""
+    user = await require_auth_async(request)
+    if isinstance(user, RedirectResponse):
+        return json_response({"error": "unauthorized"}, status_code=401)
+    if per_user:
+        key += (user["id"],)
+
+    try:
+        selected = parse_fields(fields, FIELDS[resource])
+    except ValueError as e:
+        return json_response({"error": str(e)}, status_code=400)
+
+    key += (selected,)
+
+    def read(d):
+        # Версия и данные из одного снимка: тело не попадает в кэш под чужой версией
+        with d.read_snapshot():
+            version, snapshot = source(d, user)
+            response = api_cache.cached(request, key, version)
+            if response is None:
+                response = api_cache.store(key, version, project(load(d, user, snapshot), selected))
+            return response
+
+    return await db.run(read)
+
+
+@app.get("/api/v1/exercises")
+async def api_exercises(request: Request, fields: Optional[str] = None,
+                        db: AsyncDatabase = Depends(get_async_db)):
+    return await api_response(
+        request, db, "exercise", ("exercises",), fields, catalog_source,
+        lambda d, user, catalog: {"items": list(catalog["exercises"])}
+    )
+
+
+@app.get("/api/v1/exercises/{exercise_id}")
+async def api_exercise(request: Request, exercise_id: int, fields: Optional[str] = None,
+                       db: AsyncDatabase = Depends(get_async_db)):
+    return await api_response(
+        request, db, "exercise", ("exercise", exercise_id), fields, catalog_source,
+        lambda d, user, catalog: catalog["exercise_by_id"].get(exercise_id)
+    )
+
+
+@app.get("/api/v1/advice")
+async def api_advice_list(request: Request, fields: Optional[str] = None,
+                          db: AsyncDatabase = Depends(get_async_db)):
+    return await api_response(
+        request, db, "advice", ("advice",), fields, catalog_source,
+        lambda d, user, catalog: {"items": list(catalog["advice"])}
+    )
+
+
+@app.get("/api/v1/advice/{advice_id}")
+async def api_advice(request: Request, advice_id: int, fields: Optional[str] = None,
+                     db: AsyncDatabase = Depends(get_async_db)):
+    return await api_response(
+        request, db, "advice", ("advice", advice_id), fields, catalog_source,
+        lambda d, user, catalog: catalog["advice_by_id"].get(advice_id)
+    )
+
+
+@app.get("/api/v1/comments")
+async def api_comments(request: Request, cursor: Optional[str] = None, limit: int = COMMENTS_PAGE_SIZE,
+                       fields: Optional[str] = None, db: AsyncDatabase = Depends(get_async_db)):
+    def load(d, user, _):
+        items, next_cursor = d.get_comments_page(cursor, limit)
+        return {"items": items, "next_cursor": next_cursor}
+
+    return await api_response(
+        request, db, "comments", ("comments", cursor, limit), fields, table_source("comments"), load
+    )
+
+
+@app.get("/api/v1/history")
+async def api_history(request: Request, fields: Optional[str] = None,
+                      db: AsyncDatabase = Depends(get_async_db)):
+    return await api_response(
+        request, db, "history", ("history",), fields,
+        lambda d, user: d.get_view_history_version(user["id"]),
+        lambda d, user, pending: {"items": d.get_view_history(user["id"], pending)},
+        per_user=True
+    )
+
+
 # Старые маршруты (требуют авторизации)
 @app.get("/breathing", response_class=HTMLResponse)
-def read_breathing(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_breathing(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    exercise = db.get_exercise_by_id(1)
+    exercise = await db.get_exercise_by_id(1)
     if user and exercise:
-        db.add_view_history(user["id"], "exercise", 1, exercise["name"])
+        await db.add_view_history(user["id"], "exercise", 1, exercise["name"])
+        recommender.note_view(user["id"], "exercise", 1)
 
     return templates.TemplateResponse("breathing.html", {
         "request": request,
@@ -250,14 +591,15 @@ def read_breathing(request: Request, db: Database = Depends(get_db)):
 
 
 @app.get("/muscle", response_class=HTMLResponse)
-def read_muscle(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_muscle(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    exercise = db.get_exercise_by_id(2)
+    exercise = await db.get_exercise_by_id(2)
     if user and exercise:
-        db.add_view_history(user["id"], "exercise", 2, exercise["name"])
+        await db.add_view_history(user["id"], "exercise", 2, exercise["name"])
+        recommender.note_view(user["id"], "exercise", 2)
 
     return templates.TemplateResponse("muscle.html", {
         "request": request,
@@ -268,14 +610,15 @@ def read_muscle(request: Request, db: Database = Depends(get_db)):
 
 
 @app.get("/meditation", response_class=HTMLResponse)
-def read_meditation(request: Request, db: Database = Depends(get_db)):
-    user = require_auth(request)
+async def read_meditation(request: Request, db: AsyncDatabase = Depends(get_async_db)):
+    user = await require_auth_async(request)
     if isinstance(user, RedirectResponse):
         return user
 
-    exercise = db.get_exercise_by_id(3)
+    exercise = await db.get_exercise_by_id(3)
     if user and exercise:
-        db.add_view_history(user["id"], "exercise", 3, exercise["name"])
+        await db.add_view_history(user["id"], "exercise", 3, exercise["name"])
+        recommender.note_view(user["id"], "exercise", 3)
 
     return templates.TemplateResponse("meditation.html", {
         "request": request,
@@ -286,21 +629,28 @@ def read_meditation(request: Request, db: Database = Depends(get_db)):
 
 
 # Авторизация (доступна без авторизации)
-@app.post("/login", response_class=HTMLResponse)
-def login_user(
+@app.post("/login", response_class=HTMLResponse, dependencies=[Depends(limit("login", "auth"))])
+async def login_user(
         request: Request,
         email: str = Form(...),
         password: str = Form(...),
-        db: Database = Depends(get_db)
+        db: AsyncDatabase = Depends(get_async_db)
 ):
-    if db.verify_user(email, password):
-        user = db.get_user_by_email(email)
-        session_id = secrets.token_hex(16)
-        sessions[session_id] = {
+    # Один запрос: хэш пароля и профиль; хэш проверяется в пуле процессов
+    user = await db.get_user_by_email(email)
+    # Неизвестный email проверяется по фиктивному хэшу: время ответа не выдает, есть ли такой пользователь
+    valid, needs_rehash = await verify_password_async(password, user["password"] if user else DUMMY_HASH)
+    valid = valid and user is not None
+
+    if valid:
+        if needs_rehash:
+            # Старый пароль в открытом виде (или устаревшие параметры) - перехэшируем
+            await db.update_password(user["id"], await hash_password_async(password))
+        session_id = await get_executor().run(sessions.create, {
             "id": user["id"],
             "name": user["name"],
             "email": user["email"]
-        }
+        })
         response = RedirectResponse(url="/", status_code=302)
         response.set_cookie(key="session_id", value=session_id, httponly=True)
         return response
@@ -314,20 +664,21 @@ def login_user(
 
 
 @app.get("/logout")
-def logout_user():
+def logout_user(request: Request):
+    sessions.delete(request.cookies.get("session_id"))
     response = RedirectResponse(url="/", status_code=302)
     response.delete_cookie(key="session_id")
     return response
 
 
 # Регистрация (доступна без авторизации)
-@app.post("/register", response_class=HTMLResponse)
-def register_user(
+@app.post("/register", response_class=HTMLResponse, dependencies=[Depends(limit("register", "auth"))])
+async def register_user(
         request: Request,
         name: str = Form(...),
         email: str = Form(...),
         password: str = Form(...),
-        db: Database = Depends(get_db)
+        db: AsyncDatabase = Depends(get_async_db)
 ):
     if not name or not email or not password:
         return templates.TemplateResponse("register.html", {
@@ -347,7 +698,7 @@ def register_user(
             "email": email
         })
 
-    success = db.insert_user(name, email, password)
+    success = await db.insert_user(name, email, await hash_password_async(password))
 
     if success:
         return RedirectResponse(url="/login", status_code=302)
@@ -368,11 +719,7 @@ def read_about(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("about.html", {
-        "request": request,
-        "title": "Біз туралы",
-        "user": user
-    })
+    return page_cache.response(request, "about.html", "Біз туралы", user)
 
 
 # Страницы входа и регистрации (доступны без авторизации)
@@ -382,11 +729,7 @@ def read_login(request: Request):
     # Если пользователь уже авторизован, перенаправляем на главную
     if user:
         return RedirectResponse(url="/", status_code=302)
-    return templates.TemplateResponse("login.html", {
-        "request": request,
-        "title": "Кіру",
-        "user": user
-    })
+    return page_cache.response(request, "login.html", "Кіру")
 
 
 @app.get("/register", response_class=HTMLResponse)
@@ -394,11 +737,7 @@ def read_register(request: Request):
     user = get_current_user(request)
     if user:
         return RedirectResponse(url="/", status_code=302)
-    return templates.TemplateResponse("register.html", {
-        "request": request,
-        "title": "Тіркелу",
-        "user": user
-    })
+    return page_cache.response(request, "register.html", "Тіркелу")
 
 
 # Остальные защищенные страницы
@@ -408,11 +747,7 @@ def read_balance(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("balance.html", {
-        "request": request,
-        "title": "Теңгерім",
-        "user": user
-    })
+    return page_cache.response(request, "balance.html", "Теңгерім", user)
 
 
 @app.get("/calm", response_class=HTMLResponse)
@@ -421,11 +756,7 @@ def read_calm(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("calm.html", {
-        "request": request,
-        "title": "Тыныштық",
-        "user": user
-    })
+    return page_cache.response(request, "calm.html", "Тыныштық", user)
 
 
 @app.get("/emotion", response_class=HTMLResponse)
@@ -434,11 +765,7 @@ def read_emotion(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("emotion.html", {
-        "request": request,
-        "title": "Эмоциялар",
-        "user": user
-    })
+    return page_cache.response(request, "emotion.html", "Эмоциялар", user)
 
 
 @app.get("/music", response_class=HTMLResponse)
@@ -447,11 +774,7 @@ def read_music(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("music.html", {
-        "request": request,
-        "title": "Музыка",
-        "user": user
-    })
+    return page_cache.response(request, "music.html", "Музыка", user)
 
 
 @app.get("/selfsupport", response_class=HTMLResponse)
@@ -460,11 +783,7 @@ def read_selfsupport(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("selfsupport.html", {
-        "request": request,
-        "title": "Өзін-өзі қолдау",
-        "user": user
-    })
+    return page_cache.response(request, "selfsupport.html", "Өзін-өзі қолдау", user)
 
 
 @app.get("/time", response_class=HTMLResponse)
@@ -473,11 +792,49 @@ def read_time(request: Request):
     if isinstance(user, RedirectResponse):
         return user
 
-    return templates.TemplateResponse("time.html", {
-        "request": request,
-        "title": "Уақыт",
-        "user": user
-    })
+    return page_cache.response(request, "time.html", "Уақыт", user)
+
+
+def bearer_token(request: Request) -> str:
+    return request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+
+
+def require_metrics_access(request: Request):
+    """Authorization: Bearer <SHAMSHYRAQ_METRICS_TOKEN>; без токена - прямой запрос с localhost"""
+    if METRICS_TOKEN:
+        allowed = secrets.compare_digest(bearer_token(request), METRICS_TOKEN)
+    else:
+        allowed = (request.client is not None and request.client.host in LOCAL_HOSTS
+                   and not any(header in request.headers for header in PROXY_HEADERS))
+    if not allowed:
+        raise HTTPException(status_code=404)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+def read_metrics():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def require_admin(request: Request):
+    """Authorization: Bearer <SHAMSHYRAQ_ADMIN_TOKEN>; без токена маршрутов как будто нет"""
+    if not ADMIN_TOKEN or not secrets.compare_digest(bearer_token(request), ADMIN_TOKEN):
+        raise HTTPException(status_code=404)
+
+
+# Состояние резервного копирования и список снимков
+@app.get("/admin/backup", dependencies=[Depends(require_admin)])
+def backup_status():
+    return JSONResponse({"status": backups.stats(), "last": backups.last, "backups": list_backups(backups.backup_dir)})
+
+
+# Снять копию сейчас (в фоновом потоке); mode=vacuum - сжатая копия
+@app.post("/admin/backup", dependencies=[Depends(require_admin)])
+def backup_now(mode: Optional[str] = None):
+    if mode not in (None, "backup", "vacuum"):
+        return JSONResponse({"error": "mode must be backup or vacuum"}, status_code=400)
+    if not backups.trigger(mode):
+        return JSONResponse({"error": "backup is already running"}, status_code=409)
+    return JSONResponse({"status": "started"}, status_code=202)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+"""Замеры запросов: время, рендер шаблонов и SQL.
+
+TimingMiddleware собирает по каждому запросу маршрут, общее время, время
+рендера шаблонов, число/текст/длительность SQL-запросов и отдает их в
+заголовке Server-Timing. Агрегаты доступны в формате Prometheus на /metrics
+(по SHAMSHYRAQ_METRICS_TOKEN или, без него, только с localhost).
+Медленные запросы и повторы одного и того же SQL за запрос (N+1) пишутся в лог.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Tuple, Callable
+
+import jinja2
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import datebase
+from async_db import db_timer
+
+SLOW_QUERY_MS = float(os.environ.get("SHAMSHYRAQ_SLOW_QUERY_MS", "50"))
+# Сколько раз один и тот же SQL может выполниться за запрос, прежде чем это сочтем N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("SHAMSHYRAQ_N_PLUS_ONE_THRESHOLD", "2"))
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL без литералов и лишних пробелов - одинаковый для однотипных запросов"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACES.sub(" ", sql).strip()
+    return _IN_LIST.sub("(...)", sql)
+
+
+_fingerprints: Dict[str, Tuple[str, str]] = {}
+
+
+def fingerprint(sql: str) -> Tuple[str, str]:
+    """(короткий хэш, нормализованный текст)"""
+    cached = _fingerprints.get(sql)
+    if cached is None:
+        text = normalize_sql(sql)
+        cached = (hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], text)
+        if len(_fingerprints) < 10000:
+            _fingerprints[sql] = cached
+    return cached
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # значения меток -> [счетчики корзин..., +Inf, сумма]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_values, series in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request duration", ("method", "route", "status"))
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in the database per request", ("route",))
+REQUEST_SQL_COUNT = Histogram("http_request_sql_queries", "SQL statements per request", ("route",), COUNT_BUCKETS)
+RENDER_SECONDS = Histogram("template_render_seconds", "Jinja template render time", ("template",))
+SQL_SECONDS = Histogram("sql_query_duration_seconds", "SQL statement duration", ("fingerprint",))
+
+_statements: Dict[str, str] = {}
+_slow_queries = 0
+_n_plus_one = 0
+# Дополнительные источники метрик: имя -> функция, возвращающая dict чисел
+_gauges: Dict[str, Callable[[], Dict]] = {}
+
+
+class RequestStats:
+    def __init__(self, route: str):
+        self.route = route
+        self.render = 0.0
+        self.sql: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def add_sql(self, fp: str, seconds: float):
+        with self._lock:
+            self.sql.append((fp, seconds))
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def observe_sql(sql: str, seconds: float):
+    """Наблюдатель для datebase.TracingCursor"""
+    global _slow_queries
+    fp, text = fingerprint(sql)
+    _statements.setdefault(fp, text)
+    SQL_SECONDS.observe(seconds, fp)
+    stats = _current.get()
+    if stats is not None:
+        stats.add_sql(fp, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _slow_queries += 1
+        route = stats.route if stats is not None else "background"
+        print(f"Slow query ({seconds * 1000:.1f} ms) on {route}: {text}")
+
+
+class TimedTemplate(jinja2.Template):
+    """Шаблон, замеряющий время рендера"""
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            RENDER_SECONDS.observe(elapsed, self.name or "?")
+            stats = _current.get()
+            if stats is not None:
+                stats.render += elapsed
+
+
+def _route_of(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if scope.get("endpoint") is not None:
+        return (scope.get("root_path") or "") + "/*"
+    return "unmatched"
+
+
+class TimingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        stats = RequestStats("unmatched")
+        timer = [0.0, 0.0]
+        stats_token = _current.set(stats)
+        timer_token = db_timer.set(timer)
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                stats.route = _route_of(scope)
+                sql_time = sum(seconds for _, seconds in stats.sql)
+                server_timing = (
+                    f"total;dur={(time.perf_counter() - started) * 1000:.2f}, "
+                    f"db;dur={timer[1] * 1000:.2f}, "
+                    f"dbwait;dur={timer[0] * 1000:.2f}, "
+                    f'sql;dur={sql_time * 1000:.2f};desc="{len(stats.sql)} queries", '
+                    f"render;dur={stats.render * 1000:.2f}"
+                )
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", server_timing.encode("ascii"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(stats_token)
+            db_timer.reset(timer_token)
+            stats.route = _route_of(scope)
+            self._record(scope, stats, timer, status[0], time.perf_counter() - started)
+
+    @staticmethod
+    def _record(scope: Scope, stats: RequestStats, timer: List[float], status: int, elapsed: float):
+        global _n_plus_one
+        route = stats.route
+        REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+        REQUEST_DB_SECONDS.observe(timer[1], route)
+        REQUEST_SQL_COUNT.observe(len(stats.sql), route)
+
+        counts = defaultdict(int)
+        for fp, _ in stats.sql:
+            counts[fp] += 1
+        for fp, count in counts.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                _n_plus_one += 1
+                print(f"Possible N+1 on {scope['method']} {route}: {count}x {_statements.get(fp, fp)}")
+
+
+def register_gauges(name: str, source: Callable[[], Dict]):
+    """Числовые показатели компонента (пул, кэши, очереди) в /metrics"""
+    _gauges[name] = source
+
+
+def install(templates):
+    """Включить замеры SQL и рендера шаблонов"""
+    datebase.set_sql_observer(observe_sql)
+    templates.env.template_class = TimedTemplate
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in (REQUEST_SECONDS, REQUEST_DB_SECONDS, REQUEST_SQL_COUNT, RENDER_SECONDS, SQL_SECONDS):
+        lines.extend(histogram.render())
+
+    lines.append("# HELP sql_statement_info Normalized text of each SQL fingerprint")
+    lines.append("# TYPE sql_statement_info gauge")
+    for fp, text in sorted(_statements.items()):
+        lines.append(f'sql_statement_info{{fingerprint="{fp}",statement="{_escape(text)}"}} 1')
+
+    lines.append("# TYPE sql_slow_queries_total counter")
+    lines.append(f"sql_slow_queries_total {_slow_queries}")
+    lines.append("# TYPE sql_n_plus_one_total counter")
+    lines.append(f"sql_n_plus_one_total {_n_plus_one}")
+
+    for name, source in sorted(_gauges.items()):
+        try:
+            values = source()
+        except Exception as e:
+            print(f"Error collecting metrics for {name}: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = f"shamshyraq_{name}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,595 @@
+"""Версии схемы advice.db.
+
+Номер примененной версии хранится в PRAGMA user_version. При подключении
+migrate() сравнивает его с последней миграцией: если схема актуальна,
+DDL не выполняется вовсе (один PRAGMA на соединение). Иначе недостающие
+миграции применяются по порядку, каждая в своей транзакции вместе с новым
+user_version, поэтому сбой посередине оставляет базу на предыдущей версии.
+
+Миграции только добавляются в конец MIGRATIONS; уже выпущенные не меняются.
+Поэтому миграция не читает константы модуля (SEARCH_INDEXES, KAZAKH_FOLD) -
+их значения на момент выпуска записаны в ней самой. Первые пять повторяют
+прежний create_tables и ничего не меняют в базах, созданных до появления
+версий (у них user_version = 0). Ошибка миграции останавливает запуск:
+приложение не работает со старой схемой.
+
+Изменить таблицу, которую ALTER TABLE не умеет (тип, ограничения, удаление
+колонки), можно через rebuild_table: копирование пачками без долгой
+блокировки записи (так добавлено ограничение item_type в view_history).
+Такие миграции объявляются с transactional=False; их выполняет один
+процесс (блокировка файла <база>.migrate.lock), остальные ждут. Заранее,
+до перезапуска приложения, их можно применить командой:
+
+    python migrations.py
+    python migrations.py --db data/advice.db --status
+"""
+import argparse
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Callable, NamedTuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - неттранзакционные миграции запускать одним процессом вручную
+    fcntl = None
+
+DB_PATH = os.environ.get("SHAMSHYRAQ_DB", "data/advice.db")
+REBUILD_BATCH_SIZE = int(os.environ.get("SHAMSHYRAQ_REBUILD_BATCH_SIZE", "5000"))
+
+# Полнотекстовый поиск: таблица -> (FTS5-таблица, индексируемые колонки, веса колонок для bm25).
+# Для запросов и дозаполнения индекса; изменить - только вместе с новой миграцией
+SEARCH_INDEXES = {
+    "exercise": ("exercise_fts", ("name", "description"), (10.0, 1.0)),
+    "advice": ("advice_fts", ("name", "content"), (10.0, 1.0)),
+    "comments": ("comments_fts", ("comment",), (1.0,)),
+}
+# unicode61 убирает диакритику (й -> и, ё -> е), но казахские буквы для него отдельные.
+# Сводим их к русским, чтобы "кенес" находил "кеңес" - и в индексе, и в запросе.
+# Триггеры индекса сводят по таблице из миграции 5 - изменить только вместе с новой миграцией
+KAZAKH_FOLD = {
+    "ә": "а", "ғ": "г", "қ": "к", "ң": "н", "ө": "о", "ұ": "у", "ү": "у", "һ": "х", "і": "и",
+    "Ә": "А", "Ғ": "Г", "Қ": "К", "Ң": "Н", "Ө": "О", "Ұ": "У", "Ү": "У", "Һ": "Х", "І": "И",
+}
+
+
+def fold_sql(expr: str, fold: Optional[Dict[str, str]] = None) -> str:
+    """Сведение казахских букв выражением SQL (для триггеров и заполнения индекса)"""
+    for source, target in (fold if fold is not None else KAZAKH_FOLD).items():
+        expr = f"replace({expr}, '{source}', '{target}')"
+    return expr
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable
+    # False - apply(conn) сам управляет транзакциями (rebuild_table)
+    transactional: bool = True
+
+
+def create_base_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS exercise (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            video_url TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS advice (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            content TEXT NOT NULL,
+            video_url TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            comment TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS view_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL, -- 'exercise' или 'advice'
+            item_id INTEGER NOT NULL,
+            item_name TEXT NOT NULL,
+            viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def create_comments_indexes_and_sessions(cur):
+    # Индексы для постраничного вывода комментариев и комментариев пользователя
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comments_recent ON comments (created_at DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comments_user ON comments (user_id, created_at DESC)")
+    # Таблица сессий (общая для всех воркеров)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+
+
+def dedupe_view_history(cur) -> int:
+    """Оставить по одному (самому свежему) просмотру на (user_id, item_type, item_id)"""
+    cur.execute("""
+        DELETE FROM view_history WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, item_type, item_id
+                    ORDER BY viewed_at DESC, id DESC
+                ) AS rn
+                FROM view_history
+            ) WHERE rn > 1
+        )
+    """)
+    return cur.rowcount
+
+
+def create_view_history_indexes(cur):
+    """Уникальный индекс по (user_id, item_type, item_id) и покрывающий индекс для истории"""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_view_history_item'")
+    if cur.fetchone() is None:
+        # В старых базах могут быть дубли
+        dedupe_view_history(cur)
+        cur.execute("CREATE UNIQUE INDEX idx_view_history_item ON view_history (user_id, item_type, item_id)")
+    # Покрывает SELECT * ... WHERE user_id = ? ORDER BY viewed_at DESC (id - это rowid)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_view_history_recent
+        ON view_history (user_id, viewed_at DESC, item_type, item_id, item_name)
+    """)
+
+
+def create_version_triggers(cur):
+    """Счетчики изменений таблиц для проверки актуальности кэшей"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in ("exercise", "advice", "comments", "view_history"):
+        cur.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            """)
+
+
+def create_search_index(cur):
+    """FTS5-таблицы поверх exercise, advice и comments, синхронизируются триггерами"""
+    indexes = {
+        "exercise": ("exercise_fts", ("name", "description"), (10.0, 1.0)),
+        "advice": ("advice_fts", ("name", "content"), (10.0, 1.0)),
+        "comments": ("comments_fts", ("comment",), (1.0,)),
+    }
+    fold = {
+        "ә": "а", "ғ": "г", "қ": "к", "ң": "н", "ө": "о", "ұ": "у", "ү": "у", "һ": "х", "і": "и",
+        "Ә": "А", "Ғ": "Г", "Қ": "К", "Ң": "Н", "Ө": "О", "Ұ": "У", "Ү": "У", "Һ": "Х", "І": "И",
+    }
+    for table, (fts, columns, weights) in indexes.items():
+        column_list = ", ".join(columns)
+        new_values = ", ".join(fold_sql(f"new.{c}", fold) for c in columns)
+        old_values = ", ".join(fold_sql(f"old.{c}", fold) for c in columns)
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        if cur.fetchone() is None:
+            # Внешнее содержимое: текст хранится только в исходной таблице
+            cur.execute(f"""
+                CREATE VIRTUAL TABLE {fts} USING fts5(
+                    {column_list},
+                    content='{table}', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                )
+            """)
+            weight_list = ", ".join(str(w) for w in weights)
+            cur.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({weight_list})')")
+            # 'rebuild' взял бы текст без сведения букв, поэтому заполняем сами
+            cur.execute(f"""
+                INSERT INTO {fts} (rowid, {column_list})
+                SELECT id, {", ".join(fold_sql(c, fold) for c in columns)} FROM {table}
+            """)
+
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_update AFTER UPDATE OF {column_list} ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        """)
+
+
+def create_import_progress(cur):
+    """Прогресс загрузок bulk.py; deferred - SQL индексов и триггеров, удаленных на время загрузки"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            columns TEXT,
+            offset INTEGER NOT NULL DEFAULT 0,
+            rows INTEGER NOT NULL DEFAULT 0,
+            first_id INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            deferred TEXT
+        )
+    """)
+    # Таблица могла быть создана прежней версией bulk.py
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(import_progress)")}
+    if "deferred" not in columns:
+        cur.execute("ALTER TABLE import_progress ADD COLUMN deferred TEXT")
+
+
+def create_view_events(cur):
+    """Журнал всех просмотров и сводки по дням, которые триггер обновляет в той же транзакции"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS view_events (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            viewed_at TIMESTAMP NOT NULL
+        )
+    """)
+    # Для удаления старых событий (срок хранения)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_view_events_time ON view_events (viewed_at)")
+    # Популярное за период: диапазон по (item_type, day)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS view_item_daily (
+            item_type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            views INTEGER NOT NULL,
+            PRIMARY KEY (item_type, day, item_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS view_user_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            views INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    """)
+    # Итоги пользователя: серия дней подряд считается по мере поступления событий
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS view_user_stats (
+            user_id INTEGER PRIMARY KEY,
+            views INTEGER NOT NULL,
+            active_days INTEGER NOT NULL,
+            current_streak INTEGER NOT NULL,
+            longest_streak INTEGER NOT NULL,
+            last_day TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_view_events_rollup AFTER INSERT ON view_events
+        BEGIN
+            INSERT INTO view_item_daily (item_type, day, item_id, views)
+            VALUES (new.item_type, date(new.viewed_at), new.item_id, 1)
+            ON CONFLICT (item_type, day, item_id) DO UPDATE SET views = views + 1;
+
+            INSERT INTO view_user_daily (user_id, day, views)
+            VALUES (new.user_id, date(new.viewed_at), 1)
+            ON CONFLICT (user_id, day) DO UPDATE SET views = views + 1;
+
+            INSERT INTO view_user_stats (user_id, views, active_days, current_streak, longest_streak, last_day)
+            VALUES (new.user_id, 1, 1, 1, 1, date(new.viewed_at))
+            ON CONFLICT (user_id) DO UPDATE SET
+                views = views + 1,
+                -- первый просмотр за этот день
+                active_days = active_days + (
+                    SELECT views = 1 FROM view_user_daily WHERE user_id = new.user_id AND day = date(new.viewed_at)
+                ),
+                -- событие за более ранний день (пришло с опозданием) серию не меняет
+                current_streak = CASE
+                    WHEN excluded.last_day = date(last_day, '+1 day') THEN current_streak + 1
+                    WHEN excluded.last_day > last_day THEN 1
+                    ELSE current_streak
+                END,
+                longest_streak = max(longest_streak, CASE
+                    WHEN excluded.last_day = date(last_day, '+1 day') THEN current_streak + 1
+                    ELSE 1
+                END),
+                last_day = max(last_day, excluded.last_day);
+        END
+    """)
+    # Прежние просмотры известны только по последнему на материал - с них и начинаем
+    cur.execute("SELECT 1 FROM view_events LIMIT 1")
+    if cur.fetchone() is None:
+        cur.execute("""
+            INSERT INTO view_events (user_id, item_type, item_id, viewed_at)
+            SELECT user_id, item_type, item_id, viewed_at FROM view_history ORDER BY viewed_at, id
+        """)
+
+
+def create_rate_buckets(cur):
+    # Ведра token bucket, общие для всех воркеров (rate_limit.py, SHAMSHYRAQ_RATE_BACKEND=sqlite)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rate_buckets_updated ON rate_buckets (updated_at)")
+
+
+def create_item_neighbors(cur):
+    # Похожие материалы по совместным просмотрам (recommendations.py): top-K соседей на материал
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS item_neighbors (
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            neighbor_type TEXT NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (item_type, item_id, rank)
+        ) WITHOUT ROWID
+    """)
+    # По какой версии view_history посчитаны соседи (одна строка)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS item_neighbors_build (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            source_version INTEGER NOT NULL,
+            built_at REAL NOT NULL,
+            items INTEGER NOT NULL,
+            users INTEGER NOT NULL,
+            seconds REAL NOT NULL
+        )
+    """)
+
+
+def add_view_history_item_type_check(conn: sqlite3.Connection):
+    """item_type - только 'exercise' или 'advice'; строки с другим значением не переносятся"""
+    rebuild_table(conn, "view_history", """
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL CHECK (item_type IN ('exercise', 'advice')),
+            item_id INTEGER NOT NULL,
+            item_name TEXT NOT NULL,
+            viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base tables", create_base_tables),
+    Migration(2, "comments indexes, sessions", create_comments_indexes_and_sessions),
+    Migration(3, "view_history unique and covering indexes", create_view_history_indexes),
+    Migration(4, "table_versions and version triggers", create_version_triggers),
+    Migration(5, "FTS5 search index", create_search_index),
+    Migration(6, "import_progress for bulk.py", create_import_progress),
+    Migration(7, "view_events log and daily rollups", create_view_events),
+    Migration(8, "rate_buckets for rate_limit.py", create_rate_buckets),
+    Migration(9, "item_neighbors for recommendations.py", create_item_neighbors),
+    Migration(10, "view_history item_type CHECK (online rebuild)", add_view_history_item_type_check,
+              transactional=False),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def _migration_lock(conn: sqlite3.Connection):
+    """Одна неттранзакционная миграция на базу: другие процессы ждут ее завершения"""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if fcntl is None or not path:
+        yield
+        return
+    # Не сам файл базы: закрытие его дескриптора сняло бы блокировки SQLite в процессе
+    with open(path + ".migrate.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def migrate(conn: sqlite3.Connection, target: int = LATEST_VERSION) -> int:
+    """Применить недостающие миграции; возвращает версию схемы после них.
+    Ошибка миграции пробрасывается (sqlite3.Error) - база остается на предыдущей версии"""
+    version = schema_version(conn)
+    if version >= target:
+        return version
+
+    for migration in MIGRATIONS:
+        if migration.version > target:
+            break
+        if not migration.transactional:
+            with _migration_lock(conn):
+                # Пока ждали блокировку, миграцию мог применить другой процесс
+                if migration.version <= schema_version(conn):
+                    continue
+                try:
+                    migration.apply(conn)
+                    conn.execute(f"PRAGMA user_version = {migration.version}")
+                except sqlite3.Error as e:
+                    print(f"Error applying migration {migration.version} ({migration.description}): {e}")
+                    raise
+            continue
+
+        try:
+            # IMMEDIATE: другие процессы ждут, пока эта миграция не закончится
+            conn.execute("BEGIN IMMEDIATE")
+            # Пока ждали блокировку, миграцию мог применить другой воркер
+            if migration.version <= schema_version(conn):
+                conn.rollback()
+                continue
+            cur = conn.cursor()
+            migration.apply(cur)
+            cur.execute(f"PRAGMA user_version = {migration.version}")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error applying migration {migration.version} ({migration.description}): {e}")
+            raise
+
+    return schema_version(conn)
+
+
+def _table_objects(conn: sqlite3.Connection, table: str) -> List[str]:
+    """SQL индексов и триггеров таблицы (без автоматических индексов)"""
+    return [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)
+    )]
+
+
+def rebuild_table(conn: sqlite3.Connection, table: str, create_sql: str,
+                  objects: Optional[List[str]] = None, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """Пересоздать таблицу по новому определению, не останавливая запись.
+
+    create_sql - CREATE TABLE {name} (...) для новой таблицы. Общие колонки
+    копируются пачками по id, каждая пачка - короткая транзакция; изменения,
+    сделанные во время копирования, переносятся временными триггерами.
+    В конце одна транзакция удаляет старую таблицу, переименовывает новую и
+    создает objects - индексы и триггеры (по умолчанию - прежние таблицы).
+    Возвращает число скопированных пачкой строк.
+    """
+    new = f"{table}_rebuild"
+    if objects is None:
+        objects = _table_objects(conn, table)
+
+    # Остатки прерванной перестройки
+    conn.execute(f"DROP TABLE IF EXISTS {new}")
+    for event in ("insert", "update", "delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_rebuild_{event}")
+    conn.execute(create_sql.format(name=new))
+    conn.commit()
+
+    old_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    new_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({new})")}
+    columns = [c for c in old_columns if c in new_columns]
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+
+    with conn:
+        conn.execute(f"""
+            CREATE TRIGGER trg_{table}_rebuild_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT OR REPLACE INTO {new} ({column_list}) VALUES ({new_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER trg_{table}_rebuild_update AFTER UPDATE ON {table}
+            BEGIN
+                DELETE FROM {new} WHERE id = old.id;
+                INSERT OR REPLACE INTO {new} ({column_list}) VALUES ({new_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER trg_{table}_rebuild_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM {new} WHERE id = old.id;
+            END
+        """)
+
+    # OR IGNORE: строку, уже перенесенную триггером, не перезаписываем старой копией
+    copied = 0
+    last_id = 0
+    while True:
+        bound = conn.execute(
+            f"SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?", (last_id, batch_size - 1)
+        ).fetchone()
+        upper = bound[0] if bound is not None else None
+        with conn:
+            if upper is None:
+                cur = conn.execute(
+                    f"INSERT OR IGNORE INTO {new} ({column_list}) SELECT {column_list} FROM {table} WHERE id > ?",
+                    (last_id,)
+                )
+            else:
+                cur = conn.execute(
+                    f"INSERT OR IGNORE INTO {new} ({column_list}) "
+                    f"SELECT {column_list} FROM {table} WHERE id > ? AND id <= ?",
+                    (last_id, upper)
+                )
+            copied += cur.rowcount
+        if upper is None:
+            break
+        last_id = upper
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Таблица могла получить строки после последней пачки - их уже перенесли триггеры
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new} RENAME TO {table}")
+        for sql in objects:
+            conn.execute(sql)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--status", action="store_true", help="только показать версию схемы")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    conn = sqlite3.connect(args.db)
+    try:
+        version = schema_version(conn)
+        print(f"{args.db}: schema version {version}, latest {LATEST_VERSION}")
+        for migration in MIGRATIONS:
+            if migration.version > version:
+                print(f"  pending {migration.version}: {migration.description}")
+        if not args.status and version < LATEST_VERSION:
+            try:
+                version = migrate(conn)
+            except sqlite3.Error:
+                raise SystemExit(1)
+            print(f"{args.db}: migrated to version {version}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import hashlib
+import html
+import re
+import threading
+from typing import Optional, Dict, List
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+
+from assets import preferred_image_type
+from compression import etag_matches
+
+_FIELD = re.compile(r"@@user\.(\w+)@@")
+
+
+class _UserPlaceholder:
+    """Подставляется вместо пользователя при рендере: {{ user.name }} -> @@user.name@@"""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return f"@@user.{name}@@"
+
+    def __getitem__(self, name):
+        return f"@@user.{name}@@"
+
+
+class PageCache:
+    """Кэш отрендеренных статичных страниц.
+
+    Страница рендерится один раз на (шаблон, заголовок, вошел ли пользователь,
+    формат картинок из Accept); данные пользователя вынесены в отдельные
+    фрагменты и подставляются при ответе. Ответ получает сильный ETag (после
+    сжатия - слабый), на If-None-Match отдается 304.
+    """
+
+    CACHE_CONTROL = "private, no-cache"
+
+    def __init__(self, templates: Jinja2Templates):
+        self.templates = templates
+        self._pages: Dict[tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _compile(self, request: Request, template_name: str, title: str, logged_in: bool) -> Dict:
+        template = self.templates.get_template(template_name)
+        body = template.render({
+            "request": request,
+            "title": title,
+            "user": _UserPlaceholder() if logged_in else None,
+        })
+        pieces = _FIELD.split(body)
+        # Четные элементы - статичный HTML, нечетные - поля пользователя
+        return {
+            "template": template,
+            "static": pieces[0::2],
+            "fields": pieces[1::2],
+            "digest": hashlib.sha1(body.encode("utf-8")).hexdigest()[:16],
+        }
+
+    def _page(self, request: Request, template_name: str, title: str, logged_in: bool) -> Dict:
+        key = (template_name, title, logged_in, preferred_image_type(request))
+        page = self._pages.get(key)
+        if page is not None and page["template"].is_up_to_date:
+            self.hits += 1
+            return page
+        page = self._compile(request, template_name, title, logged_in)
+        with self._lock:
+            self._pages[key] = page
+            self.misses += 1
+        return page
+
+    def response(self, request: Request, template_name: str, title: str,
+                 user: Optional[dict] = None) -> Response:
+        page = self._page(request, template_name, title, user is not None)
+        values: List[str] = [html.escape(str(user.get(field, ""))) for field in page["fields"]] if user else []
+
+        etag = page["digest"]
+        if values:
+            etag += "-" + hashlib.sha1("\0".join(values).encode("utf-8")).hexdigest()[:16]
+        etag = f'"{etag}"'
+        headers = {"ETag": etag, "Cache-Control": self.CACHE_CONTROL, "Vary": "Cookie, Accept"}
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        static = page["static"]
+        parts = [static[0]]
+        for value, chunk in zip(values, static[1:]):
+            parts.append(value)
+            parts.append(chunk)
+        return HTMLResponse("".join(parts), headers=headers)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "pages": len(self._pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
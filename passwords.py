@@ -0,0 +1,91 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+# Параметры scrypt: ~16 МБ памяти и несколько десятков мс CPU на один хэш
+SCRYPT_N = int(os.environ.get("SHAMSHYRAQ_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+SALT_BYTES = 16
+HASH_WORKERS = int(os.environ.get("SHAMSHYRAQ_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+PREFIX = "scrypt"
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          dklen=dklen, maxmem=128 * r * (n + p + 2) + 1024 * 1024)
+
+
+def hash_password(password: str) -> str:
+    """Хэш вида scrypt$n$r$p$соль$хэш"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P, SCRYPT_DKLEN)
+    return f"{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+# Для неизвестного email: проверка стоит столько же, сколько настоящая, и никогда не проходит
+DUMMY_HASH = f"{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(bytes(SALT_BYTES))}${_b64(bytes(SCRYPT_DKLEN))}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(PREFIX + "$")
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """(пароль верный, нужно перехэшировать)
+
+    Старые записи с паролем в открытом виде тоже проверяются - их нужно
+    перехэшировать при успешном входе.
+    """
+    if not is_hashed(stored):
+        ok = hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+        return ok, ok
+
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+    except ValueError:
+        return False, False
+
+    ok = hmac.compare_digest(_scrypt(password, salt, n, r, p, len(digest)), digest)
+    outdated = (n, r, p, len(digest)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P, SCRYPT_DKLEN)
+    return ok, ok and outdated
+
+
+# Пул процессов для хэширования: не блокирует ни event loop, ни пулы потоков
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def init_hasher(workers: int = HASH_WORKERS) -> ProcessPoolExecutor:
+    global _pool
+    _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def close_hasher():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, hash_password, password)
+
+
+async def verify_password_async(password: str, stored: str) -> Tuple[bool, bool]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, verify_password, password, stored)
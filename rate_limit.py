@@ -0,0 +1,237 @@
+"""Ограничение частоты и одновременности дорогих маршрутов (вход, регистрация, комментарии).
+
+RateLimiter - token bucket на клиента: пользователя из сессии или, без
+сессии, IP. В ведре capacity жетонов, они восполняются равномерно за
+period секунд, каждый запрос забирает один. По умолчанию ведра живут в
+памяти процесса; SHAMSHYRAQ_RATE_BACKEND=sqlite держит их в таблице
+rate_buckets, общей для всех воркеров (один UPSERT на запрос).
+
+ConcurrencyLimiter - сколько запросов класса маршрутов выполняется
+одновременно; лишние сразу получают 503 с Retry-After, а не ждут в
+очереди без предела.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Tuple
+
+from datebase import open_db
+
+# 0 - без ограничения частоты (нагрузочные тесты с одного адреса)
+RATE_LIMIT_ENABLED = os.environ.get("SHAMSHYRAQ_RATE_LIMIT", "1") != "0"
+RATE_BACKEND = os.environ.get("SHAMSHYRAQ_RATE_BACKEND", "local")
+# Сколько своих обратных прокси стоит перед приложением (0 - X-Forwarded-For не читается).
+# Каждый прокси дописывает адрес справа, поэтому клиент - N-я запись с конца;
+# записи левее клиент может подставить сам
+RATE_TRUST_PROXY = int(os.environ.get("SHAMSHYRAQ_RATE_TRUST_PROXY", "0"))
+RATE_LOCAL_MAX = int(os.environ.get("SHAMSHYRAQ_RATE_LOCAL_MAX", "100000"))
+RATE_PURGE_INTERVAL = float(os.environ.get("SHAMSHYRAQ_RATE_PURGE_INTERVAL", "300"))
+
+
+def _rule(name: str, default: str) -> Tuple[float, float]:
+    """"10/60" - 10 запросов за 60 секунд -> (capacity, жетонов в секунду)"""
+    value = os.environ.get(f"SHAMSHYRAQ_RATE_{name.upper()}", default)
+    count, _, period = value.partition("/")
+    return float(count), float(count) / float(period or 1)
+
+
+# правило -> (размер ведра, жетонов в секунду)
+RATE_RULES: Dict[str, Tuple[float, float]] = {
+    "login": _rule("login", "10/60"),
+    "register": _rule("register", "5/600"),
+    "comment": _rule("comment", "20/60"),
+}
+
+# класс маршрутов -> сколько запросов выполняется одновременно
+CONCURRENCY_LIMITS: Dict[str, int] = {
+    # Хэширование паролей в пуле процессов
+    "auth": int(os.environ.get("SHAMSHYRAQ_CONCURRENCY_AUTH", "16")),
+    # Запись через единственный Writer
+    "write": int(os.environ.get("SHAMSHYRAQ_CONCURRENCY_WRITE", "32")),
+}
+
+
+class RateLimited(RuntimeError):
+    """Клиент исчерпал свое ведро"""
+
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(f"Rate limit {rule} exceeded, retry after {retry_after:.1f}s")
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+class Overloaded(RuntimeError):
+    """Класс маршрутов занят полностью"""
+
+    def __init__(self, route_class: str, retry_after: float = 1):
+        super().__init__(f"Too many concurrent {route_class} requests")
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+class LocalBuckets:
+    """Ведра в памяти процесса"""
+
+    blocking = False
+
+    def __init__(self, max_size: int = RATE_LOCAL_MAX):
+        self.max_size = max_size
+        # ключ -> [жетоны, время обновления]
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_size:
+                    # Переполнение (перебор IP) - сбрасываем самые старые ведра
+                    for old in list(self._buckets)[:self.max_size // 10 or 1]:
+                        del self._buckets[old]
+                bucket = self._buckets[key] = [capacity, now]
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def purge(self, before: float) -> int:
+        with self._lock:
+            idle = [key for key, bucket in self._buckets.items() if bucket[1] < before]
+            for key in idle:
+                del self._buckets[key]
+        return len(idle)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """Ведра в таблице rate_buckets, общей для всех воркеров"""
+
+    blocking = True
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        with open_db() as db:
+            return db.take_rate_token(key, capacity, rate, now)
+
+    def purge(self, before: float) -> int:
+        with open_db() as db:
+            return db.delete_idle_rate_buckets(before)
+
+    def __len__(self):
+        return 0
+
+
+class RateLimiter:
+    """Token bucket по правилам RATE_RULES.
+
+    Ведро, не тронутое дольше времени полного восполнения, снова полное -
+    такие ведра удаляются фоновым потоком раз в purge_interval секунд.
+    """
+
+    def __init__(self, backend=None, rules: Optional[Dict[str, Tuple[float, float]]] = None,
+                 purge_interval: float = RATE_PURGE_INTERVAL, enabled: bool = RATE_LIMIT_ENABLED):
+        if backend is None:
+            backend = SQLiteBuckets() if RATE_BACKEND == "sqlite" else LocalBuckets()
+        self.backend = backend
+        self.rules = rules if rules is not None else RATE_RULES
+        self.purge_interval = purge_interval
+        self.enabled = enabled
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.allowed = {rule: 0 for rule in self.rules}
+        self.limited = {rule: 0 for rule in self.rules}
+        self.purged = 0
+
+    def hit(self, rule: str, client: str, now: Optional[float] = None) -> float:
+        """Учесть запрос; 0 - разрешен, иначе через сколько секунд повторить"""
+        if not self.enabled:
+            return 0.0
+        capacity, rate = self.rules[rule]
+        retry_after = self.backend.take(f"{rule}:{client}", capacity, rate, time.time() if now is None else now)
+        if retry_after > 0:
+            self.limited[rule] += 1
+        else:
+            self.allowed[rule] += 1
+        return retry_after
+
+    def purge(self) -> int:
+        now = time.time()
+        refill = max(capacity / rate for capacity, rate in self.rules.values())
+        removed = self.backend.purge(now - refill)
+        self.purged += removed
+        return removed
+
+    def _run(self):
+        while not self._stopped.wait(self.purge_interval):
+            self.purge()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="rate-purge", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict:
+        result = {"buckets": len(self.backend), "purged": self.purged}
+        for rule in self.rules:
+            result[f"{rule}_allowed"] = self.allowed[rule]
+            result[f"{rule}_limited"] = self.limited[rule]
+        return result
+
+
+class ConcurrencyLimiter:
+    """Не больше limits[класс] одновременных запросов класса; лишние отклоняются сразу"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = limits if limits is not None else CONCURRENCY_LIMITS
+        self.active = {name: 0 for name in self.limits}
+        self.peak = {name: 0 for name in self.limits}
+        self.rejected = {name: 0 for name in self.limits}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, route_class: str):
+        with self._lock:
+            if self.active[route_class] >= self.limits[route_class]:
+                self.rejected[route_class] += 1
+                raise Overloaded(route_class)
+            self.active[route_class] += 1
+            self.peak[route_class] = max(self.peak[route_class], self.active[route_class])
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active[route_class] -= 1
+
+    def stats(self) -> Dict:
+        result = {}
+        for name, limit in self.limits.items():
+            result[f"{name}_limit"] = limit
+            result[f"{name}_active"] = self.active[name]
+            result[f"{name}_peak"] = self.peak[name]
+            result[f"{name}_rejected"] = self.rejected[name]
+        return result
+
+
+def client_ip(request, trusted_hops: int = RATE_TRUST_PROXY) -> str:
+    if trusted_hops > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if len(forwarded) >= trusted_hops:
+            return forwarded[-trusted_hops]
+    return request.client.host if request.client else "unknown"
@@ -0,0 +1,239 @@
+"""Рекомендации "что открыть дальше" по совместным просмотрам.
+
+Фоновый поток раз в RECO_INTERVAL секунд (если view_history изменилась)
+строит матрицу совместных просмотров материалов C = B^T B, где B -
+разреженная матрица "пользователь x материал" из view_history. B хранится
+парами индексов (читаются из БД потоком, 24 байта на строку) и
+разворачивается в плотные блоки по RECO_BLOCK_USERS пользователей, так что
+блоки не растут с числом пользователей. Сходство - косинус
+C[i, j] / sqrt(n_i * n_j); для каждого материала остаются RECO_NEIGHBORS
+лучших соседей, они сохраняются в item_neighbors. Другие воркеры берут
+соседей из таблицы, если они посчитаны по той же версии view_history.
+
+Затем для каждого пользователя считаются кандидаты: оценки B_u @ S, без
+уже просмотренного. На запросе остается только поиск в словаре - без
+обращений к БД. Без numpy рекомендации выключены.
+"""
+import os
+import threading
+import time
+from typing import Optional, Dict, List, Tuple
+
+from datebase import open_db
+
+try:
+    import numpy as np
+except ImportError:  # numpy не установлен - рекомендаций нет
+    np = None
+
+RECO_INTERVAL = float(os.environ.get("SHAMSHYRAQ_RECO_INTERVAL", "600"))
+RECO_NEIGHBORS = int(os.environ.get("SHAMSHYRAQ_RECO_NEIGHBORS", "10"))
+# Сколько пользователей разворачивается в плотный блок за раз
+RECO_BLOCK_USERS = int(os.environ.get("SHAMSHYRAQ_RECO_BLOCK_USERS", "4096"))
+# Кандидатов на пользователя (с запасом на то, что он откроет после расчета)
+RECO_USER_CANDIDATES = 20
+RECO_LIMIT = 3
+
+ITEM_TYPES = ("exercise", "advice")
+
+
+class Recommender:
+    """Соседи материалов и кандидаты пользователей в памяти процесса"""
+
+    def __init__(self, interval: float = RECO_INTERVAL, neighbors: int = RECO_NEIGHBORS,
+                 block_users: int = RECO_BLOCK_USERS):
+        self.interval = interval
+        self.neighbors = neighbors
+        self.block_users = block_users
+        # (тип, id) -> [{"type", "id", "name", "score"}, ...] по убыванию сходства
+        self._similar: Dict[Tuple[str, int], List[Dict]] = {}
+        # user_id -> кандидаты в порядке убывания оценки
+        self._candidates: Dict[int, List[Dict]] = {}
+        # Что пользователь открыл после расчета - не предлагать снова
+        self._seen: Dict[int, set] = {}
+        self._version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.builds = 0
+        self.computed = 0
+        self.last_seconds = 0.0
+        self.items = 0
+        self.users = 0
+
+    # Поиск на запросе: O(K), без БД
+    def similar(self, item_type: str, item_id: int, limit: int = RECO_LIMIT * 2) -> List[Dict]:
+        return self._similar.get((item_type, item_id), [])[:limit]
+
+    def for_user(self, user_id: int, limit: int = RECO_LIMIT) -> Dict[str, List[Dict]]:
+        """До limit упражнений и limit советов для пользователя"""
+        result = {item_type: [] for item_type in ITEM_TYPES}
+        seen = self._seen.get(user_id, ())
+        for item in self._candidates.get(user_id, ()):
+            picked = result[item["type"]]
+            if len(picked) < limit and (item["type"], item["id"]) not in seen:
+                picked.append(item)
+        return result
+
+    def note_view(self, user_id: int, item_type: str, item_id: int):
+        if user_id in self._candidates:
+            with self._lock:
+                self._seen.setdefault(user_id, set()).add((item_type, item_id))
+
+    # Расчет в фоновом потоке
+    def refresh(self) -> bool:
+        """Пересчитать, если view_history или каталог изменились; True - пересчитано.
+
+        Память: пары из view_history - 24 байта на строку (int64, без объектов
+        Python); блок пользователей - block_users x items float32. Матрицы
+        items x items плотные (без SciPy): в пике их около пяти по 4 байта на
+        ячейку, то есть ~20 * items^2 байт - 1 000 материалов ~ 20 МБ,
+        10 000 ~ 2 ГБ. На больший каталог нужна разреженная C.
+        """
+        with open_db() as db:
+            version = (db.get_table_version("view_history"), db.get_table_version(*ITEM_TYPES))
+            if version == self._version:
+                return False
+            started = time.perf_counter()
+            items = [("exercise", e["id"], e["name"]) for e in db.get_all_exercises()]
+            items += [("advice", a["id"], a["name"]) for a in db.get_all_advice()]
+            pairs = np.fromiter(db.iter_view_pairs(), dtype=np.int64).reshape(-1, 3)
+            build = db.get_item_neighbors_build()
+            stored = db.get_item_neighbors() if build is not None and build["source_version"] == version[0] else None
+
+            # Материал -> строка матрицы; ключ id * 2 + is_advice
+            keys = np.array([item_id * 2 + (item_type == "advice") for item_type, item_id, _ in items], dtype=np.int64)
+            order = np.argsort(keys)
+            pair_keys = pairs[:, 2] * 2 + pairs[:, 1]
+            pos = np.minimum(np.searchsorted(keys[order], pair_keys), max(len(keys) - 1, 0))
+            known = keys[order][pos] == pair_keys if len(keys) else np.zeros(len(pairs), dtype=bool)
+            users, user_idx = np.unique(pairs[known, 0], return_inverse=True)
+            item_idx = order[pos[known]]
+
+            if stored is not None:
+                index = {(item_type, item_id): i for i, (item_type, item_id, _) in enumerate(items)}
+                scores = self._load_neighbors(stored, index, len(items))
+            else:
+                scores = self._top_neighbors(self._cooccurrence(user_idx, item_idx, len(users), len(items)))
+                rows = []
+                for i, (item_type, item_id, _) in enumerate(items):
+                    for rank, j in enumerate(self._ranked(scores[i])):
+                        rows.append((item_type, item_id, rank, items[j][0], items[j][1], float(scores[i, j])))
+                db.save_item_neighbors(version[0], rows, len(items), len(users), time.perf_counter() - started)
+                self.computed += 1
+        candidates = self._user_candidates(user_idx, item_idx, len(users), scores)
+
+        entries = [{"type": item_type, "id": item_id, "name": name} for item_type, item_id, name in items]
+        similar = {}
+        for i, (item_type, item_id, _) in enumerate(items):
+            similar[(item_type, item_id)] = [dict(entries[j], score=round(float(scores[i, j]), 4))
+                                             for j in self._ranked(scores[i])]
+        by_user = {int(users[u]): [entries[j] for j in row if j >= 0] for u, row in enumerate(candidates)}
+        with self._lock:
+            self._similar = similar
+            self._candidates = by_user
+            self._seen = {}
+            self._version = version
+        self.builds += 1
+        self.items = len(items)
+        self.users = len(users)
+        self.last_seconds = time.perf_counter() - started
+        return True
+
+    def _cooccurrence(self, user_idx, item_idx, n_users: int, n_items: int):
+        """C = B^T B блоками по block_users пользователей (B - 0/1, пары отсортированы по пользователю)"""
+        order = np.argsort(user_idx, kind="stable")
+        user_idx, item_idx = user_idx[order], item_idx[order]
+        cooc = np.zeros((n_items, n_items), dtype=np.float32)
+        for start in range(0, n_users, self.block_users):
+            lo, hi = np.searchsorted(user_idx, [start, start + self.block_users])
+            block = np.zeros((min(self.block_users, n_users - start), n_items), dtype=np.float32)
+            block[user_idx[lo:hi] - start, item_idx[lo:hi]] = 1
+            cooc += block.T @ block
+        return cooc
+
+    def _top_neighbors(self, cooc):
+        """Косинус по совместным просмотрам; в каждой строке остаются neighbors лучших"""
+        counts = np.sqrt(np.diag(cooc))
+        norm = np.outer(counts, counts)
+        sim = np.divide(cooc, norm, out=np.zeros_like(cooc), where=norm > 0)
+        np.fill_diagonal(sim, 0)
+        k = min(self.neighbors, max(sim.shape[0] - 1, 0))
+        if k == 0:
+            return np.zeros_like(sim)
+        top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        scores = np.zeros_like(sim)
+        rows = np.arange(sim.shape[0])[:, None]
+        scores[rows, top] = sim[rows, top]
+        return scores
+
+    @staticmethod
+    def _load_neighbors(stored, index: Dict[Tuple[str, int], int], n_items: int):
+        scores = np.zeros((n_items, n_items), dtype=np.float32)
+        for row in stored:
+            i = index.get((row["item_type"], row["item_id"]))
+            j = index.get((row["neighbor_type"], row["neighbor_id"]))
+            if i is not None and j is not None:
+                scores[i, j] = row["score"]
+        return scores
+
+    @staticmethod
+    def _ranked(row) -> List[int]:
+        """Индексы ненулевых соседей по убыванию сходства"""
+        nonzero = np.flatnonzero(row)
+        return nonzero[np.argsort(-row[nonzero], kind="stable")].tolist()
+
+    def _user_candidates(self, user_idx, item_idx, n_users: int, scores):
+        """Оценки B_u @ S для каждого пользователя без уже просмотренного; -1 - нет кандидата"""
+        n_items = scores.shape[0]
+        k = min(RECO_USER_CANDIDATES, n_items)
+        result = np.full((n_users, k), -1, dtype=np.int32)
+        if k == 0:
+            return result
+        order = np.argsort(user_idx, kind="stable")
+        user_idx, item_idx = user_idx[order], item_idx[order]
+        for start in range(0, n_users, self.block_users):
+            lo, hi = np.searchsorted(user_idx, [start, start + self.block_users])
+            block = np.zeros((min(self.block_users, n_users - start), n_items), dtype=np.float32)
+            block[user_idx[lo:hi] - start, item_idx[lo:hi]] = 1
+            user_scores = block @ scores
+            user_scores[block > 0] = 0
+            top = np.argpartition(-user_scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(user_scores, top, axis=1)
+            ranked = np.take_along_axis(top, np.argsort(-top_scores, axis=1, kind="stable"), axis=1)
+            ranked[np.take_along_axis(user_scores, ranked, axis=1) <= 0] = -1
+            result[start:start + len(block)] = ranked
+        return result
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error building recommendations: {e}")
+            if self._stopped.wait(self.interval):
+                break
+
+    def start(self):
+        if np is None:
+            print("numpy is not installed, recommendations are disabled")
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="recommendations", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            "items": self.items,
+            "users": self.users,
+            "builds": self.builds,
+            "computed": self.computed,
+            "last_seconds": self.last_seconds,
+        }
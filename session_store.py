@@ -0,0 +1,164 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict
+
+from datebase import open_db
+
+SESSION_TTL = float(os.environ.get("SHAMSHYRAQ_SESSION_TTL", str(7 * 24 * 3600)))
+# Сколько секунд воркер доверяет своей копии сессии, не сверяясь с общим хранилищем.
+# Столько же после выхода сессия еще действует в других воркерах
+SESSION_LOCAL_TTL = float(os.environ.get("SHAMSHYRAQ_SESSION_LOCAL_TTL", "5"))
+SESSION_LOCAL_MAX = int(os.environ.get("SHAMSHYRAQ_SESSION_LOCAL_MAX", "10000"))
+SESSION_EVICT_INTERVAL = float(os.environ.get("SHAMSHYRAQ_SESSION_EVICT_INTERVAL", "300"))
+
+
+class SQLiteSessionBackend:
+    """Общее хранилище сессий в таблице sessions"""
+
+    def load(self, session_id: str, now: float) -> Optional[Dict]:
+        with open_db() as db:
+            row = db.get_session(session_id, now)
+        if row is None:
+            return None
+        return {"user": json.loads(row["data"]), "expires_at": row["expires_at"]}
+
+    def save(self, session_id: str, user: Dict, expires_at: float):
+        with open_db() as db:
+            db.save_session(session_id, user["id"], json.dumps(user, ensure_ascii=False), expires_at)
+
+    def touch(self, session_id: str, expires_at: float):
+        with open_db() as db:
+            db.touch_session(session_id, expires_at)
+
+    def delete(self, session_id: str):
+        with open_db() as db:
+            db.delete_session(session_id)
+
+    def purge(self, now: float) -> int:
+        with open_db() as db:
+            return db.delete_expired_sessions(now)
+
+
+class SessionStore:
+    """Сессии со скользящим сроком жизни.
+
+    Перед общим хранилищем (backend) стоит LRU-кэш процесса. Срок жизни
+    продлевается при каждом обращении, но в хранилище записывается не чаще
+    раза в touch_interval секунд.
+
+    Кэшируются только найденные сессии. delete() убирает сессию из кэша
+    своего процесса и из хранилища, но другие воркеры узнают о выходе не
+    позже чем через local_ttl секунд, когда сверятся с хранилищем.
+    """
+
+    def __init__(self, backend=None, ttl: float = SESSION_TTL,
+                 local_ttl: float = SESSION_LOCAL_TTL, local_max: int = SESSION_LOCAL_MAX,
+                 evict_interval: float = SESSION_EVICT_INTERVAL):
+        self.backend = backend if backend is not None else SQLiteSessionBackend()
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_max = local_max
+        self.evict_interval = evict_interval
+        self.touch_interval = min(ttl / 10, 3600)
+        # session_id -> {"user", "expires_at", "stored_expires_at", "cached_at"}
+        self._local: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def create(self, user: Dict) -> str:
+        session_id = secrets.token_hex(16)
+        now = time.time()
+        expires_at = now + self.ttl
+        self.backend.save(session_id, user, expires_at)
+        self._remember(session_id, user, expires_at, expires_at, now)
+        return session_id
+
+    def get(self, session_id: Optional[str]) -> Optional[Dict]:
+        if not session_id:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._local.get(session_id)
+            if entry is not None and (entry["expires_at"] <= now or entry["cached_at"] + self.local_ttl <= now):
+                # Истекла или пора сверить с общим хранилищем
+                del self._local[session_id]
+                entry = None
+            if entry is not None:
+                self._local.move_to_end(session_id)
+                self.hits += 1
+
+        if entry is None:
+            self.misses += 1
+            stored = self.backend.load(session_id, now)
+            if stored is None:
+                return None
+            entry = self._remember(session_id, stored["user"], stored["expires_at"], stored["expires_at"], now)
+
+        # Скользящее продление срока жизни
+        entry["expires_at"] = now + self.ttl
+        if entry["expires_at"] - entry["stored_expires_at"] >= self.touch_interval:
+            entry["stored_expires_at"] = entry["expires_at"]
+            self.backend.touch(session_id, entry["expires_at"])
+        return entry["user"]
+
+    def delete(self, session_id: Optional[str]):
+        if not session_id:
+            return
+        with self._lock:
+            self._local.pop(session_id, None)
+        self.backend.delete(session_id)
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, entry in self._local.items() if entry["expires_at"] <= now]
+            for sid in expired:
+                del self._local[sid]
+        removed = self.backend.purge(now)
+        self.evicted += removed
+        return removed
+
+    def _remember(self, session_id: str, user: Dict, expires_at: float,
+                  stored_expires_at: float, now: float) -> Dict:
+        entry = {
+            "user": user,
+            "expires_at": expires_at,
+            "stored_expires_at": stored_expires_at,
+            "cached_at": now,
+        }
+        with self._lock:
+            self._local[session_id] = entry
+            self._local.move_to_end(session_id)
+            while len(self._local) > self.local_max:
+                self._local.popitem(last=False)
+        return entry
+
+    def _run(self):
+        while not self._stopped.wait(self.evict_interval):
+            self.evict_expired()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="session-evict", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            local = len(self._local)
+        return {"local": local, "hits": self.hits, "misses": self.misses, "evicted": self.evicted}
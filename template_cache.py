@@ -0,0 +1,64 @@
+"""Байткод шаблонов Jinja2 на диске и прогрев при старте.
+
+Без кэша каждый воркер разбирает и компилирует шаблон при первом обращении
+к странице. FileSystemBytecodeCache сохраняет скомпилированный код в
+TEMPLATE_CACHE_DIR (общий для всех воркеров; запись атомарная), а warm_up
+загружает все шаблоны до того, как воркер начнет принимать запросы.
+Измененный шаблон перекомпилируется сам: ключ кэша включает хэш исходника.
+
+    python template_cache.py    # заранее скомпилировать все шаблоны (при деплое)
+"""
+import argparse
+import os
+import time
+from typing import Tuple
+
+from jinja2 import FileSystemBytecodeCache
+
+from assets import MinifyHtmlExtension
+
+TEMPLATE_DIR = "templates"
+# Пустое значение - без кэша байткода
+TEMPLATE_CACHE_DIR = os.environ.get("SHAMSHYRAQ_TEMPLATE_CACHE", "data/template_cache")
+# Проверять изменение файлов шаблонов при каждом рендере (только для разработки)
+TEMPLATE_AUTO_RELOAD = os.environ.get("SHAMSHYRAQ_TEMPLATE_AUTO_RELOAD", "0") == "1"
+TEMPLATE_WARMUP = os.environ.get("SHAMSHYRAQ_TEMPLATE_WARMUP", "1") != "0"
+MINIFY_HTML = os.environ.get("SHAMSHYRAQ_MINIFY_HTML", "1") != "0"
+
+
+def configure(templates, cache_dir: str = TEMPLATE_CACHE_DIR, auto_reload: bool = TEMPLATE_AUTO_RELOAD,
+              minify: bool = MINIFY_HTML):
+    env = templates.env
+    env.auto_reload = auto_reload
+    if minify:
+        env.add_extension(MinifyHtmlExtension)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Ключ кэша считается по исходнику до минификации - байткод с ней и без нее хранится отдельно
+        pattern = "__jinja2_min_%s.cache" if minify else "__jinja2_%s.cache"
+        env.bytecode_cache = FileSystemBytecodeCache(cache_dir, pattern)
+
+
+def warm_up(templates) -> Tuple[int, float]:
+    """Загрузить (и при необходимости скомпилировать) все шаблоны; (число шаблонов, секунды)"""
+    started = time.perf_counter()
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache-dir", default=TEMPLATE_CACHE_DIR or "data/template_cache")
+    args = parser.parse_args()
+
+    from fastapi.templating import Jinja2Templates
+    templates = Jinja2Templates(directory=TEMPLATE_DIR)
+    configure(templates, args.cache_dir)
+    count, seconds = warm_up(templates)
+    print(f"{count} templates compiled into {args.cache_dir} in {seconds * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import re
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+VIDEO_DIR = os.environ.get("SHAMSHYRAQ_VIDEO_DIR", "static")
+VIDEO_TYPES = {".mp4": "video/mp4", ".webm": "video/webm", ".mp3": "audio/mpeg"}
+CHUNK_SIZE = 256 * 1024
+VIDEO_IO_WORKERS = int(os.environ.get("SHAMSHYRAQ_VIDEO_IO_WORKERS", "4"))
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Чтение файлов идет в своем пуле потоков, а не в общем пуле Starlette
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=VIDEO_IO_WORKERS, thread_name_prefix="video-io")
+    return _io_pool
+
+
+def close_video_io():
+    global _io_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False)
+        _io_pool = None
+
+
+def parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) включительно; None - заголовок не разобран (отдаем файл целиком).
+
+    Несколько диапазонов не поддерживаются - для видео браузеры их не шлют.
+    ValueError - диапазон за пределами файла (416).
+    """
+    match = _RANGE.match(value.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # Последние N байт
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class VideoResponse(Response):
+    """Файл целиком (200) или диапазон байт (206) с проверкой ETag/Last-Modified.
+
+    Память ограничена одним блоком CHUNK_SIZE; если сервер поддерживает
+    расширения ASGI pathsend/zerocopysend, файл отдается без копирования.
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, media_type: str):
+        super().__init__(media_type=media_type)
+        self.path = path
+        self.size = stat_result.st_size
+        self.media_type = media_type
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+    def _not_modified(self, headers: Headers) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or self.etag in [t.strip() for t in if_none_match.split(",")]
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(self.last_modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_allowed(self, headers: Headers) -> bool:
+        if_range = headers.get("if-range")
+        return if_range is None or if_range.strip() in (self.etag, self.last_modified)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self._send(scope, send)
+        if self.background is not None:
+            await self.background()
+
+    async def _send(self, scope: Scope, send: Send):
+        headers = Headers(scope=scope)
+        base = [
+            (b"accept-ranges", b"bytes"),
+            (b"etag", self.etag.encode()),
+            (b"last-modified", self.last_modified.encode()),
+            (b"cache-control", b"public, max-age=86400"),
+        ]
+
+        if self._not_modified(headers):
+            await send({"type": "http.response.start", "status": 304, "headers": base})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        byte_range = None
+        if headers.get("range") and self._range_allowed(headers):
+            try:
+                byte_range = parse_range(headers["range"], self.size)
+            except ValueError:
+                await send({"type": "http.response.start", "status": 416,
+                            "headers": base + [(b"content-range", f"bytes */{self.size}".encode())]})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if byte_range is None:
+            status, start, end = 200, 0, self.size - 1
+            extra = []
+        else:
+            status, (start, end) = 206, byte_range
+            extra = [(b"content-range", f"bytes {start}-{end}/{self.size}".encode())]
+        length = end - start + 1 if self.size else 0
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": base + extra + [
+                (b"content-type", self.media_type.encode()),
+                (b"content-length", str(length).encode()),
+            ],
+        })
+        if scope["method"] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if status == 200 and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+
+        loop = asyncio.get_running_loop()
+        pool = _get_io_pool()
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in extensions:
+                # Сервер сам отдаст файл через sendfile
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": start, "count": length})
+                return
+
+            position = start
+            remaining = length
+            fd = f.fileno()
+            while remaining > 0:
+                chunk = await loop.run_in_executor(pool, os.pread, fd, min(CHUNK_SIZE, remaining), position)
+                if not chunk:
+                    break
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Файл укоротился во время отдачи
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def video_response(name: str) -> VideoResponse:
+    media_type = VIDEO_TYPES.get(os.path.splitext(name)[1].lower())
+    if media_type is None or os.path.basename(name) != name or name.startswith("."):
+        raise HTTPException(status_code=404)
+
+    path = os.path.join(VIDEO_DIR, name)
+    loop = asyncio.get_running_loop()
+    try:
+        stat_result = await loop.run_in_executor(_get_io_pool(), os.stat, path)
+    except OSError:
+        raise HTTPException(status_code=404)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404)
+    return VideoResponse(path, stat_result, media_type)